@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'rest_framework_simplejwt.token_blacklist',
@@ -81,6 +82,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'PatchHelper.wsgi.application'
 
+# Serve the patch list, patch detail, patch content and landing page stats with their async views,
+# which only pay off under an ASGI server such as uvicorn PatchHelper.asgi:application. The async
+# views are also served under api/async/ either way.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', '') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
@@ -116,7 +122,7 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'patcher.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -140,8 +146,52 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
     'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
     'JTI_CLAIM': 'jti',
+    'TOKEN_REFRESH_SERIALIZER': 'patcher.serializers.CachedTokenRefreshSerializer',
 }
 
+# Local memory cache by default, point CACHE_BACKEND/CACHE_LOCATION at a shared cache
+# (e.g. django.core.cache.backends.redis.RedisCache) when running several workers
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Anonymous feed pages are cached for FEED_CACHE_TIMEOUT seconds or until a patch changes
+FEED_CACHE_TIMEOUT = 30
+FEED_CACHE_LOCK_TIMEOUT = 5
+
+# Landing page stats are served from the cache for STATS_CACHE_TIMEOUT seconds
+STATS_CACHE_TIMEOUT = 10
+
+# Running stats changed on every vote are summed in memory and written every STATS_FLUSH_INTERVAL seconds
+STATS_FLUSH_INTERVAL = 2
+
+# Uploaded images get WebP and JPEG derivatives at these widths, generated by IMAGE_PIPELINE_WORKERS
+# threads after the upload commits (0 generates them inline)
+IMAGE_DERIVATIVE_WIDTHS = [320, 640, 1280]
+IMAGE_PIPELINE_WORKERS = 2
+
+# Authenticated users are cached with their profile for AUTH_USER_CACHE_TIMEOUT seconds per token,
+# saving the user or the profile invalidates them
+AUTH_USER_CACHE_TIMEOUT = 60
+
+# Uploads are streamed to disk and rejected once they grow past UPLOAD_MAX_SIZE bytes
+UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+
+# Larger files are uploaded in parts of at most UPLOAD_PART_MAX_SIZE bytes, the parts are kept in
+# UPLOAD_SESSION_ROOT until the upload completes or has been idle for UPLOAD_SESSION_TTL seconds
+UPLOAD_SESSION_MAX_SIZE = 500 * 1024 * 1024
+UPLOAD_PART_MAX_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+UPLOAD_SESSION_ROOT = os.path.join(BASE_DIR, 'upload_sessions')
+
+# Buffer upvotes in memory and write them in batches every VOTE_BUFFER_FLUSH_INTERVAL seconds
+VOTE_BUFFER_ENABLED = False
+VOTE_BUFFER_FLUSH_INTERVAL = 2
+VOTE_BUFFER_BATCH_SIZE = 1000
+
 APPEND_SLASH = True
 CORS_ALLOW_ALL_ORIGINS = True
 
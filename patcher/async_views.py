@@ -0,0 +1,151 @@
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework.response import Response
+
+from .cache import is_feed_cacheable
+from .cache import get_feed_cache_key
+from .cache import get_stats_cache_key
+from .cache import aget_feed_version
+from .cache import aget_or_compute
+from .conditional import AsyncConditionalGetMixin
+from .pagination import AsyncPageNumberPagination
+from .serializers import PatchContentSerializer
+from .views import PatchViewSet
+from .views import PatchDetail
+from .views import PatchContentViewSet
+from .views import LandingPageStatViewSet
+
+# rows fetched per round trip, aiterator needs it once a queryset prefetches relations
+CHUNK_SIZE = 2000
+
+class AsyncViewMixin:
+    """
+    APIView mixin running the handlers as coroutines under ASGI.
+
+    Authentication, permissions and throttles may query the database and run in a thread,
+    the handlers load their rows with the async ORM and serialize them once loaded, every
+    relation a serializer reads being selected or prefetched with the rows. Synchronous
+    handlers such as options are called as they are.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+class AsyncPatchViewSet(AsyncViewMixin, PatchViewSet):
+    """Async view for listing patches"""
+
+    async def get(self, request, *args, **kwargs):
+        # anonymous feed pages are shared until the feed changes
+        if is_feed_cacheable(request):
+            key = get_feed_cache_key(request, await aget_feed_version())
+            data = await aget_or_compute(key, self.alist_data)
+            return Response(data)
+
+        return await self.alist_page(request)
+
+    async def alist_data(self):
+        return (await self.alist_page(self.request)).data
+
+    async def alist_page(self, request):
+        """Method to return the response for a page of the feed"""
+
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+class AsyncPatchDetail(AsyncViewMixin, AsyncConditionalGetMixin, PatchDetail):
+    """Async view for retrieving a patch, updates and deletes run the synchronous handlers in a thread"""
+
+    async def aget_validators(self):
+        query = self.get_validators_query()
+        return self.build_validators(await query.afirst()) if query is not None else None
+
+    async def aget_response(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+
+        try:
+            instance = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, ValidationError, ValueError, TypeError) as exc:
+            raise Http404 from exc
+
+        self.check_object_permissions(request, instance)
+
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    async def put(self, request, *args, **kwargs):
+        return await sync_to_async(super().put)(request, *args, **kwargs)
+
+    async def patch(self, request, *args, **kwargs):
+        return await sync_to_async(super().patch)(request, *args, **kwargs)
+
+    async def delete(self, request, *args, **kwargs):
+        return await sync_to_async(super().delete)(request, *args, **kwargs)
+
+class AsyncPatchContentViewSet(AsyncViewMixin, AsyncConditionalGetMixin, PatchContentViewSet):
+    """Async view for listing patch contents"""
+
+    async def aget_validators(self):
+        return self.build_validators(await self.get_validators_query().afirst())
+
+    async def aget_response(self, request, *args, **kwargs):
+        blocks = [block async for block in self.get_queryset().aiterator(chunk_size=CHUNK_SIZE)]
+
+        serializer = PatchContentSerializer(blocks, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+class AsyncLandingPageStatViewSet(AsyncViewMixin, AsyncConditionalGetMixin, LandingPageStatViewSet):
+    """Async view for listing landing page stats"""
+
+    pagination_class = AsyncPageNumberPagination
+
+    async def aget_stats(self):
+        """Method to return the page of stats, shared by all clients for STATS_CACHE_TIMEOUT seconds"""
+
+        if not hasattr(self, 'stats'):
+            timeout = getattr(settings, 'STATS_CACHE_TIMEOUT', 10)
+            self.stats = await aget_or_compute(get_stats_cache_key(self.request), self.alist_data, timeout)
+
+        return self.stats
+
+    async def alist_data(self):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data).data
+
+    async def aget_validators(self):
+        # the cached page is its own version, a 304 costs no query
+        return await self.aget_stats(), None
+
+    async def aget_response(self, request, *args, **kwargs):
+        return Response(await self.aget_stats())
@@ -0,0 +1,163 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+def get_user_cache_timeout():
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+def get_user_version_key(user_id):
+    return f'patcher:auth:{user_id}:version'
+
+def get_user_cache_key(user_id, jti):
+    return f'patcher:auth:{user_id}:{jti}'
+
+def invalidate_cached_user(user_id):
+    """Drop the cached user and profile of every token of a user"""
+
+    # the version is only compared, a new clock value works whether it was evicted or not
+    cache.set(get_user_version_key(user_id), time.time_ns(), None)
+
+def is_cache_shared():
+    """Check if the default cache is shared by every worker, a per-process cache misses their writes"""
+
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication caching the resolved user per token.
+
+    The user is cached with its profile for AUTH_USER_CACHE_TIMEOUT seconds under the
+    (user id, token jti) pair, along with the user's version. Saving the user or its
+    profile moves the version on, so one cache round trip tells a valid entry from a
+    stale one and authenticated requests need no query for the user or its profile.
+    The version only moves in the cache of the worker which saved, so users are only
+    cached in a cache shared by every worker.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if user_id is None or jti is None or not is_cache_shared():
+            return super().get_user(validated_token)
+
+        key = get_user_cache_key(user_id, jti)
+        version_key = get_user_version_key(user_id)
+        cached = cache.get_many([key, version_key])
+
+        version = cached.get(version_key)
+        if version is None:
+            version = time.time_ns()
+            if not cache.add(version_key, version, None):
+                version = cache.get(version_key)
+
+        entry = cached.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        # checks the user exists and is active like the default authentication
+        user = super().get_user(validated_token)
+
+        try:
+            # loaded now so the profile is cached along with the user
+            user.profile
+        except ObjectDoesNotExist:
+            pass
+
+        cache.set(key, (version, user), get_user_cache_timeout())
+        return user
+
+def get_blacklist_cache_key(jti):
+    return f'patcher:blacklist:{jti}'
+
+def get_remaining_lifetime(payload):
+    """Return the seconds until a token expires, its blacklist entry is useless afterwards"""
+
+    return max(1, int(payload['exp'] - time.time()))
+
+class CachedRefreshToken(RefreshToken):
+    """
+    Refresh token caching the result of its blacklist check until it expires.
+
+    A token is refreshed many times during its lifetime and is almost never blacklisted,
+    so only its first check reaches the token_blacklist tables. Blacklisting a token
+    overwrites its entry while checks only add missing entries, so a token is turned
+    away as soon as it is blacklisted. A blacklisted token stays blacklisted, but a
+    "not blacklisted" entry is only trusted in a cache shared by every worker: a
+    per-process cache would keep accepting a token blacklisted by another worker.
+    """
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        key = get_blacklist_cache_key(jti)
+
+        blacklisted = cache.get(key)
+        if blacklisted is None or (not blacklisted and not is_cache_shared()):
+            blacklisted = BlacklistedToken.objects.filter(token__jti=jti).exists()
+            if blacklisted:
+                cache.set(key, True, get_remaining_lifetime(self.payload))
+            elif is_cache_shared():
+                cache.add(key, False, get_remaining_lifetime(self.payload))
+
+        if blacklisted:
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        result = super().blacklist()
+        cache.set(get_blacklist_cache_key(self.payload[api_settings.JTI_CLAIM]), True, get_remaining_lifetime(self.payload))
+        return result
+
+# the blacklist rows are deleted by the same statement, the foreign key is checked at commit
+PURGE_SQL = """
+WITH batch AS (
+    SELECT {outstanding_pk} AS pk FROM {outstanding_table}
+    WHERE expires_at <= %(now)s
+    ORDER BY expires_at
+    LIMIT %(limit)s
+), blacklisted AS (
+    DELETE FROM {blacklisted_table}
+    WHERE token_id IN (SELECT pk FROM batch)
+)
+DELETE FROM {outstanding_table}
+WHERE {outstanding_pk} IN (SELECT pk FROM batch)
+"""
+
+def purge_expired_tokens(batch_size=10000):
+    """
+    Delete the outstanding and blacklisted rows of expired tokens, one statement per batch.
+
+    Expired tokens are rejected before the blacklist is checked, so their rows are dead
+    weight. Batches walk the expires_at index and keep each transaction short. Yields the
+    number of tokens deleted by each batch.
+    """
+
+    quote = connection.ops.quote_name
+    outstanding_table = quote(OutstandingToken._meta.db_table)
+    sql = PURGE_SQL.format(
+        outstanding_table=outstanding_table,
+        outstanding_pk=f'{outstanding_table}.{quote(OutstandingToken._meta.pk.column)}',
+        blacklisted_table=quote(BlacklistedToken._meta.db_table),
+    )
+
+    now = timezone.now()
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'now': now, 'limit': batch_size})
+            deleted = cursor.rowcount
+
+        if not deleted:
+            return
+
+        yield deleted
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+FEED_VERSION_KEY = 'patcher:feed:version'
+# query parameters a cached feed page may depend on, other parameters bypass the cache
+FEED_CACHE_PARAMS = {
+    'ordering', 'page', 'page_size',
+    'author', 'created_after', 'created_before', 'version', 'min_upvotes', 'has_thumbnail',
+}
+
+def get_feed_version():
+    """Return the current version of the patch feed"""
+
+    version = cache.get(FEED_VERSION_KEY)
+    if version is None:
+        # start from the clock, so an evicted version never reuses old cache entries
+        cache.add(FEED_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(FEED_VERSION_KEY)
+
+    return version
+
+def bump_feed_version():
+    """Invalidate every cached feed page"""
+
+    try:
+        cache.incr(FEED_VERSION_KEY)
+    except ValueError:
+        cache.set(FEED_VERSION_KEY, time.time_ns(), None)
+
+def is_feed_cacheable(request):
+    """Check if the feed page for the request can be shared with other clients"""
+
+    return not request.user.is_authenticated and set(request.query_params) <= FEED_CACHE_PARAMS
+
+async def aget_feed_version():
+    """Async version of get_feed_version"""
+
+    version = await cache.aget(FEED_VERSION_KEY)
+    if version is None:
+        await cache.aadd(FEED_VERSION_KEY, time.time_ns(), None)
+        version = await cache.aget(FEED_VERSION_KEY)
+
+    return version
+
+def get_feed_cache_key(request, version=None):
+    """Build the cache key of a feed page, for the current feed version unless one is given"""
+
+    if version is None:
+        version = get_feed_version()
+
+    params = '&'.join(f'{name}={request.query_params.get(name, "")}' for name in sorted(FEED_CACHE_PARAMS))
+    return f'patcher:feed:{version}:{request.scheme}://{request.get_host()}:{params}'
+
+def get_stats_cache_key(request):
+    """Build the cache key of a page of landing page stats"""
+
+    return f'patcher:stats:{request.scheme}://{request.get_host()}:{request.query_params.get("page", "")}'
+
+def get_or_compute(key, compute, timeout=None):
+    """
+    Return the cached value for the key, computing it on a miss.
+
+    Entries are kept for twice their timeout: once an entry is older than its timeout a
+    single client recomputes it while the others are served the stale value, and on a
+    miss the other clients wait for the one computing it instead of hitting the database.
+    """
+
+    timeout = timeout or getattr(settings, 'FEED_CACHE_TIMEOUT', 30)
+    lock_timeout = getattr(settings, 'FEED_CACHE_LOCK_TIMEOUT', 5)
+    lock_key = f'{key}:lock'
+
+    entry = cache.get(key)
+    locked = cache.add(lock_key, True, lock_timeout) if entry is None or entry[0] <= time.time() else False
+
+    if entry is not None and not locked:
+        return entry[1]
+
+    if entry is None and not locked:
+        # another client is computing the value, wait for it
+        deadline = time.time() + lock_timeout
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[1]
+
+    try:
+        value = compute()
+        cache.set(key, (time.time() + timeout, value), timeout * 2)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+    return value
+
+async def aget_or_compute(key, compute, timeout=None):
+    """Async version of get_or_compute, compute is a coroutine function"""
+
+    timeout = timeout or getattr(settings, 'FEED_CACHE_TIMEOUT', 30)
+    lock_timeout = getattr(settings, 'FEED_CACHE_LOCK_TIMEOUT', 5)
+    lock_key = f'{key}:lock'
+
+    entry = await cache.aget(key)
+    locked = await cache.aadd(lock_key, True, lock_timeout) if entry is None or entry[0] <= time.time() else False
+
+    if entry is not None and not locked:
+        return entry[1]
+
+    if entry is None and not locked:
+        # another client is computing the value, wait for it without holding a thread
+        deadline = time.time() + lock_timeout
+        while time.time() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await cache.aget(key)
+            if entry is not None:
+                return entry[1]
+
+    try:
+        value = await compute()
+        await cache.aset(key, (time.time() + timeout, value), timeout * 2)
+    finally:
+        if locked:
+            await cache.adelete(lock_key)
+
+    return value
@@ -0,0 +1,90 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+class ConditionalGetMixin:
+    """
+    View mixin answering GET requests with If-None-Match/If-Modified-Since.
+
+    get_validators runs a cheap query before anything is serialized, when the client
+    already has the current representation the view returns 304 Not Modified.
+    """
+
+    def get_validators(self):
+        """
+        Method to return a (version, last_modified) pair for the requested resource.
+
+        version is any value which changes with the representation, last_modified is a
+        datetime or None when the timestamp alone does not cover the representation.
+        Returning None skips conditional handling.
+        """
+
+        return None
+
+    def get_etag(self, version):
+        """Method to build the ETag of a version, the representation also depends on the query and renderer"""
+
+        request = self.request
+        source = repr((version, request.get_full_path(), request.accepted_renderer.format))
+        return quote_etag(hashlib.md5(source.encode()).hexdigest())
+
+    def get_not_modified(self, request, validators):
+        """Method to return the (etag, last_modified, not_modified) of the validators, not_modified is None unless a 304 applies"""
+
+        version, last_modified = validators
+        etag = self.get_etag(version)
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+
+        return etag, last_modified, not_modified
+
+    def set_validator_headers(self, response, etag, last_modified):
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+
+        return response
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+
+        etag, last_modified, not_modified = self.get_not_modified(request, validators)
+        if not_modified is not None:
+            return not_modified
+
+        return self.set_validator_headers(super().get(request, *args, **kwargs), etag, last_modified)
+
+class AsyncConditionalGetMixin(ConditionalGetMixin):
+    """
+    ConditionalGetMixin for async views.
+
+    The validators come from the coroutine aget_validators and the response from
+    aget_response, which views implement instead of their synchronous get. By default
+    both run the synchronous get_validators and get of the view in a thread.
+    """
+
+    async def aget_validators(self):
+        return await sync_to_async(self.get_validators)()
+
+    async def aget_response(self, request, *args, **kwargs):
+        # the handler below ConditionalGetMixin, the validators are handled here
+        return await sync_to_async(super(ConditionalGetMixin, self).get)(request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        validators = await self.aget_validators()
+        if validators is None:
+            return await self.aget_response(request, *args, **kwargs)
+
+        etag, last_modified, not_modified = self.get_not_modified(request, validators)
+        if not_modified is not None:
+            return not_modified
+
+        return self.set_validator_headers(await self.aget_response(request, *args, **kwargs), etag, last_modified)
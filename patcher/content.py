@@ -0,0 +1,162 @@
+import json
+
+from rest_framework import serializers
+
+from .models import PatchContent
+from .search import update_search_vectors
+from .images import image_pipeline
+from .images import needs_derivatives
+
+def parse_content(initial_data):
+    """Parse the JSON encoded list of content blocks sent along with a patch"""
+
+    try:
+        content_data = json.loads(initial_data.get('content'))
+    except json.JSONDecodeError as exc:
+        raise serializers.ValidationError("Content's JSON is invalid", code='invalid') from exc
+    except TypeError as exc:
+        raise serializers.ValidationError("Content must be a JSON array", code='invalid') from exc
+
+    if not isinstance(content_data, list):
+        raise serializers.ValidationError("Content must be a JSON array", code='invalid')
+
+    return content_data
+
+def validate_blocks(blocks):
+    """Check the PatchContent invariants for a batch of blocks, raising a ValidationError listing every invalid one"""
+
+    errors = []
+    for block in blocks:
+        try:
+            block.check_invariants()
+            errors.append({})
+        except ValueError as exc:
+            errors.append({'non_field_errors': [str(exc)]})
+
+    if any(errors):
+        raise serializers.ValidationError(errors)
+
+def build_blocks(content_data):
+    """Validate every block up front, returning unsaved PatchContent instances without a post"""
+    from .serializers import PatchContentSerializer
+
+    serializer = PatchContentSerializer(data=content_data, many=True)
+    if not serializer.is_valid():
+        raise serializers.ValidationError(serializer.errors)
+
+    blocks = []
+    for data in serializer.validated_data:
+        data.pop('post', None)
+        blocks.append(PatchContent(**data))
+
+    return blocks
+
+def create_blocks(patch, blocks):
+    """Insert the blocks of a patch with a single query, the caller is responsible for the transaction"""
+
+    for block in blocks:
+        block.post = patch
+
+    validate_blocks(blocks)
+
+    blocks = PatchContent.objects.bulk_create(blocks)
+    update_search_vectors([patch.pk])
+    queue_derivatives(blocks)
+    return blocks
+
+def queue_derivatives(blocks):
+    """Queue the image derivatives of blocks written in bulk, which skips the post_save signal"""
+
+    for block in blocks:
+        if needs_derivatives(block, 'images'):
+            image_pipeline.submit(block, 'images')
+
+def _block_id(entry):
+    try:
+        return int(entry['id'])
+    except (TypeError, ValueError) as exc:
+        raise serializers.ValidationError("Content ID is invalid", code='invalid') from exc
+
+def diff_blocks(patch, content_data):
+    """
+    Compare the submitted list of blocks with the stored blocks of a patch.
+
+    The submitted list is the complete content of the patch: entries with an id update
+    that block, entries without one are new blocks and stored blocks missing from the
+    list are deleted. Blocks without an explicit order take their position in the list.
+    Returns a (inserts, updates, update_fields, deletes) tuple.
+    """
+    from .serializers import PatchContentSerializer
+
+    existing = {block.id: block for block in PatchContent.objects.filter(post=patch)}
+
+    new_entries = []
+    update_entries = []
+    seen = set()
+
+    for position, entry in enumerate(content_data, start=1):
+        if not isinstance(entry, dict):
+            raise serializers.ValidationError("Content blocks must be JSON objects", code='invalid')
+
+        entry = {key: value for key, value in entry.items() if key != 'post'}
+        entry.setdefault('order', position)
+
+        if entry.get('id') is None:
+            entry.pop('id', None)
+            new_entries.append(entry)
+            continue
+
+        block_id = _block_id(entry)
+        if block_id not in existing:
+            raise serializers.ValidationError("Content ID does not exist", code='invalid')
+        if block_id in seen:
+            raise serializers.ValidationError("Content ID was given more than once", code='invalid')
+
+        seen.add(block_id)
+        update_entries.append((existing[block_id], entry))
+
+    inserts = build_blocks(new_entries)
+    for block in inserts:
+        block.post = patch
+
+    serializer = PatchContentSerializer(data=[entry for _, entry in update_entries], many=True, partial=True)
+    if not serializer.is_valid():
+        raise serializers.ValidationError(serializer.errors)
+
+    updates = []
+    update_fields = set()
+    for (block, _), data in zip(update_entries, serializer.validated_data):
+        changed = {field for field, value in data.items() if getattr(block, field) != value}
+        for field in changed:
+            setattr(block, field, data[field])
+
+        if changed:
+            updates.append(block)
+            update_fields |= changed
+
+    validate_blocks(inserts + updates)
+
+    deletes = [block_id for block_id in existing if block_id not in seen]
+
+    return inserts, updates, sorted(update_fields), deletes
+
+def apply_blocks_diff(patch, diff):
+    """
+    Write a diff returned by diff_blocks with at most one INSERT, UPDATE and DELETE.
+
+    The caller is responsible for the transaction, which should lock the patch row from
+    before the diff was computed so that no concurrent update changes the blocks in between.
+    """
+
+    inserts, updates, update_fields, deletes = diff
+
+    if deletes:
+        PatchContent.objects.filter(post=patch, id__in=deletes).delete()
+    if updates:
+        PatchContent.objects.bulk_update(updates, update_fields)
+    if inserts:
+        PatchContent.objects.bulk_create(inserts)
+    if deletes or inserts or 'text' in update_fields:
+        update_search_vectors([patch.pk])
+
+    queue_derivatives(inserts + updates)
@@ -0,0 +1,43 @@
+from django.db.models import Q
+from django_filters import rest_framework as filters
+
+from .models import Patch
+
+class PatchFilter(filters.FilterSet):
+    """
+    FilterSet for the patch lists.
+
+    Every filter is a predicate one of the Patch indexes can answer: author with the
+    (user, created) index, created and min_upvotes with the published feed indexes,
+    version and has_thumbnail with their own partial indexes.
+    """
+
+    author = filters.NumberFilter(field_name='user')
+    state = filters.ChoiceFilter(choices=Patch.STATE_CHOICES, method='filter_state')
+    created_after = filters.IsoDateTimeFilter(field_name='created', lookup_expr='gte')
+    created_before = filters.IsoDateTimeFilter(field_name='created', lookup_expr='lt')
+    version = filters.CharFilter(field_name='version')
+    min_upvotes = filters.NumberFilter(field_name='upvotes', lookup_expr='gte')
+    has_thumbnail = filters.BooleanFilter(method='filter_has_thumbnail')
+
+    class Meta:
+        model = Patch
+        fields = ['author', 'state', 'created_after', 'created_before', 'version', 'min_upvotes', 'has_thumbnail']
+
+    def filter_state(self, queryset, name, value):
+        """Method to filter by state, drafts and hidden patches are only listed for their owner"""
+
+        if value != 'published':
+            user = getattr(self.request, 'user', None)
+            if user is None or not user.is_authenticated:
+                return queryset.none()
+            queryset = queryset.filter(user=user)
+
+        return queryset.filter(state=value)
+
+    def filter_has_thumbnail(self, queryset, name, value):
+        """Method to filter by the presence of a thumbnail, blank thumbnails are stored as empty strings"""
+
+        if value:
+            return queryset.filter(thumbnail__gt='')
+        return queryset.filter(Q(thumbnail__isnull=True) | Q(thumbnail=''))
@@ -0,0 +1,160 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Profile
+from .cache import bump_feed_version
+from .authentication import invalidate_cached_user
+
+logger = logging.getLogger(__name__)
+
+# format -> (file extension, Pillow save options)
+DERIVATIVE_FORMATS = {
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+def get_derivative_widths():
+    return sorted(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', [320, 640, 1280]))
+
+def derivative_name(name, width, fmt):
+    """Return the storage name of a derivative, next to the other derivatives of the original"""
+
+    root, _ = os.path.splitext(name)
+    return f'derivatives/{root}_{width}w.{DERIVATIVE_FORMATS[fmt][0]}'
+
+def generate_derivatives(name):
+    """
+    Write the resized derivatives of a stored image.
+
+    Widths larger than the original are left out, an original narrower than every width
+    gets one derivative at its own width. Returns a {format: {width: name}} map, empty when
+    the file is missing or not an image.
+    """
+
+    try:
+        with default_storage.open(name) as file:
+            image = ImageOps.exif_transpose(Image.open(file))
+            image.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning('Could not read image %s for its derivatives', name)
+        return {}
+
+    widths = [width for width in get_derivative_widths() if width < image.width] or [image.width]
+    derivatives = {fmt: {} for fmt in DERIVATIVE_FORMATS}
+
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+
+        for fmt, (_, options) in DERIVATIVE_FORMATS.items():
+            # JPEG has no alpha channel
+            frame = resized.convert('RGB') if fmt == 'jpeg' or resized.mode not in ('RGB', 'RGBA') else resized
+            buffer = io.BytesIO()
+            frame.save(buffer, format=fmt.upper(), **options)
+
+            target = derivative_name(name, width, fmt)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            derivatives[fmt][str(width)] = default_storage.save(target, ContentFile(buffer.getvalue()))
+
+    return derivatives
+
+def get_image_names(instance, field):
+    """Return the names of the raster images stored in an image field or an array of images"""
+
+    value = getattr(instance, field)
+    names = [str(name) for name in value if name] if isinstance(value, (list, tuple)) else [value.name] if value else []
+
+    # vector images such as the default avatar scale without derivatives
+    return [name for name in names if not name.lower().endswith('.svg')]
+
+def needs_derivatives(instance, field):
+    """Check if the stored derivatives do not match the images of the field, without a query"""
+
+    return set(get_image_names(instance, field)) != set(instance.image_derivatives or {})
+
+class ImagePipeline:
+    """
+    Worker pool generating image derivatives after uploads.
+
+    Jobs are queued once the saving transaction commits and run in a thread pool, each job
+    regenerates the derivatives of one model instance and stores the {image: {format:
+    {width: name}}} map in its image_derivatives column. Jobs are lost if the process dies.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+
+    @property
+    def workers(self):
+        return getattr(settings, 'IMAGE_PIPELINE_WORKERS', 2)
+
+    def submit(self, instance, field):
+        """Queue the derivatives of an instance's image field, a non-positive worker count runs the job inline"""
+
+        job = (type(instance), instance.pk, field)
+
+        if self.workers <= 0:
+            transaction.on_commit(lambda: self.process(*job))
+            return
+
+        transaction.on_commit(lambda: self.get_executor().submit(self.run, *job))
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-pipeline')
+            return self.executor
+
+    def run(self, model, pk, field):
+        try:
+            self.process(model, pk, field)
+        except Exception:
+            logger.exception('Generating image derivatives of %s %s failed', model.__name__, pk)
+        finally:
+            connection.close()
+
+    def process(self, model, pk, field):
+        """Generate the missing derivatives of an instance and store their map"""
+
+        instance = model.objects.filter(pk=pk).only(field, 'image_derivatives').first()
+        if instance is None:
+            return
+
+        stored = instance.image_derivatives or {}
+        derivatives = {
+            name: stored[name] if name in stored else generate_derivatives(name)
+            for name in get_image_names(instance, field)
+        }
+
+        # skipped if the images changed meanwhile, the job queued by that save stores them
+        value = getattr(instance, field)
+        if isinstance(value, (list, tuple)):
+            unchanged = Q(**{field: value})
+        elif value:
+            unchanged = Q(**{field: value.name})
+        else:
+            unchanged = Q(**{f'{field}__isnull': True}) | Q(**{field: ''})
+
+        updated = model.objects.filter(unchanged, pk=pk).update(image_derivatives=derivatives)
+
+        # update() skips the signals, the cached feed pages may list the thumbnail
+        if updated:
+            bump_feed_version()
+
+            # and the authentication caches the profile along with its user
+            if model is Profile:
+                invalidate_cached_user(model.objects.filter(pk=pk).values_list('user_id', flat=True).first())
+
+image_pipeline = ImagePipeline()
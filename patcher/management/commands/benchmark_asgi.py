@@ -0,0 +1,93 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patcher.models import Patch
+
+class Command(BaseCommand):
+    help = ('Compare the requests/sec of the sync read views with their async versions under api/async/, '
+            'against a running ASGI server such as: uvicorn PatchHelper.asgi:application')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server')
+        parser.add_argument('--concurrency', type=int, default=50, help='Number of connections sending requests')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds each endpoint is loaded')
+
+    def handle(self, *args, **options):
+        patch = Patch.objects.filter(state='published').order_by('-created').first()
+        if patch is None:
+            raise CommandError('No published patch to request, seed some first (e.g. benchmark_search --keep)')
+
+        # pagination is not a feed cache parameter, so the list pages are read from the database
+        endpoints = {
+            'patch list': 'patches/?pagination=cursor',
+            'patch detail': f'patches/{patch.uuid}/?expand=content',
+            'patch content': f'patches/{patch.uuid}/content',
+            'landing stats': 'LandingPageStat/',
+        }
+
+        url = urlsplit(options['url'])
+        for name, path in endpoints.items():
+            for kind, prefix in [('sync', '/api/'), ('async', '/api/async/')]:
+                timings, errors = asyncio.run(self.load(url, prefix + path, options['concurrency'], options['duration']))
+                self.report(f'{name} ({kind})', timings, errors, options['duration'])
+
+    async def load(self, url, path, concurrency, duration):
+        """Send requests for path on concurrency connections for duration seconds, returns the timings and errors"""
+
+        timings = []
+        errors = []
+        deadline = time.perf_counter() + duration
+
+        await asyncio.gather(*(self.worker(url, path, deadline, timings, errors) for _ in range(concurrency)))
+        return timings, errors
+
+    async def worker(self, url, path, deadline, timings, errors):
+        reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        request = (f'GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\nAccept: application/json\r\n'
+                   'Connection: keep-alive\r\n\r\n').encode()
+
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                writer.write(request)
+                await writer.drain()
+
+                status = await self.read_response(reader)
+                if status == 200:
+                    timings.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors.append(status)
+        finally:
+            writer.close()
+
+    async def read_response(self, reader):
+        """Read one response from a keep-alive connection, returns its status"""
+
+        head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        status = int(head[0].split()[1])
+        headers = {name.strip().lower(): value.strip() for name, _, value in (line.partition(':') for line in head[1:] if line)}
+
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+
+        return status
+
+    def report(self, name, timings, errors, duration):
+        if not timings:
+            self.stdout.write(f'{name:<24} no successful requests, {len(errors)} errors')
+            return
+
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) >= 20 else timings[-1]
+        self.stdout.write(f'{name:<24} {len(timings) / duration:8.1f} req/s, median {statistics.median(timings):.1f}ms, '
+                          f'p95 {p95:.1f}ms, {len(errors)} errors')
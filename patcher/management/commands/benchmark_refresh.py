@@ -0,0 +1,90 @@
+import statistics
+import time
+import uuid
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.contrib.auth import models as auth_models
+from django.db import connection
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from patcher.authentication import get_blacklist_cache_key
+from patcher.serializers import CachedTokenRefreshSerializer
+
+class Command(BaseCommand):
+    help = 'Seed blacklisted tokens and compare the latency of token refreshes with and without the blacklist cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, default=10000000, help='Number of blacklisted tokens seeded')
+        parser.add_argument('--refreshes', type=int, default=1000, help='Number of refreshes measured')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded tokens')
+
+    def handle(self, *args, **options):
+        prefix = f'bench-{uuid.uuid4().hex[:8]}-'
+        user = auth_models.User.objects.create_user(username=prefix.rstrip('-'))
+
+        try:
+            start = time.perf_counter()
+            self.seed(prefix, options['tokens'])
+            self.stdout.write(f'Seeded {options["tokens"]} blacklisted tokens in {time.perf_counter() - start:.1f}s')
+
+            refresh = RefreshToken.for_user(user)
+            cache.delete(get_blacklist_cache_key(refresh['jti']))
+
+            self.report('database', self.run(TokenRefreshSerializer, str(refresh), options['refreshes']))
+            self.report('cached', self.run(CachedTokenRefreshSerializer, str(refresh), options['refreshes']))
+        finally:
+            if not options['keep']:
+                self.clean(prefix)
+            user.delete()
+
+    def seed(self, prefix, count):
+        """Insert the outstanding and blacklisted rows with two INSERT ... SELECT statements"""
+
+        quote = connection.ops.quote_name
+        outstanding = quote(OutstandingToken._meta.db_table)
+        blacklisted = quote(BlacklistedToken._meta.db_table)
+
+        with connection.cursor() as cursor:
+            # expiring later than the purge would remove them, like the tokens of a day of logouts
+            cursor.execute(f"""
+                INSERT INTO {outstanding} (jti, token, created_at, expires_at)
+                SELECT %(prefix)s || i, '', NOW(), NOW() + INTERVAL '1 day'
+                FROM generate_series(1, %(count)s) AS i
+            """, {'prefix': prefix, 'count': count})
+            cursor.execute(f"""
+                INSERT INTO {blacklisted} (token_id, blacklisted_at)
+                SELECT id, NOW() FROM {outstanding} WHERE jti LIKE %(pattern)s
+            """, {'pattern': f'{prefix}%'})
+            cursor.execute(f'ANALYZE {outstanding}')
+            cursor.execute(f'ANALYZE {blacklisted}')
+
+    def clean(self, prefix):
+        quote = connection.ops.quote_name
+        outstanding = quote(OutstandingToken._meta.db_table)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                DELETE FROM {quote(BlacklistedToken._meta.db_table)}
+                WHERE token_id IN (SELECT id FROM {outstanding} WHERE jti LIKE %(pattern)s)
+            """, {'pattern': f'{prefix}%'})
+            cursor.execute(f'DELETE FROM {outstanding} WHERE jti LIKE %(pattern)s', {'pattern': f'{prefix}%'})
+
+    def run(self, serializer_class, refresh, count):
+        """Refresh the same token count times, returns the timings"""
+
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            serializer = serializer_class(data={'refresh': refresh})
+            serializer.is_valid(raise_exception=True)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        return sorted(timings)
+
+    def report(self, name, timings):
+        p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) >= 20 else timings[-1]
+        self.stdout.write(f'{name:<9} {len(timings)} refreshes: median {statistics.median(timings):.3f}ms, '
+                          f'p95 {p95:.3f}ms, max {timings[-1]:.3f}ms')
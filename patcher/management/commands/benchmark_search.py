@@ -0,0 +1,97 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth import models as auth_models
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory
+
+from patcher.models import Patch, PatchContent
+from patcher.search import update_search_vectors
+from patcher.stats import refresh_stats
+from patcher.views import PatchSearchView
+
+class Command(BaseCommand):
+    help = 'Seed synthetic patches and content blocks and measure the latency of the search endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patches', type=int, default=10000, help='Number of patches seeded')
+        parser.add_argument('--blocks', type=int, default=100, help='Number of content blocks per patch')
+        parser.add_argument('--queries', type=int, default=50, help='Number of searches measured')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of patches inserted per transaction')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        # a vocabulary small enough for words to repeat across patches
+        words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 9))) for _ in range(5000)]
+
+        user = auth_models.User.objects.create_user(username=f'bench-{uuid.uuid4().hex[:8]}')
+
+        try:
+            start = time.perf_counter()
+            self.seed(user, words, rng, options)
+            self.stdout.write(f'Seeded {options["patches"]} patches with {options["patches"] * options["blocks"]} blocks '
+                              f'in {time.perf_counter() - start:.1f}s')
+
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(Patch._meta.db_table)}')
+
+            timings = self.run(words, rng, options['queries'])
+            self.report(timings)
+        finally:
+            if not options['keep']:
+                Patch.objects.filter(user=user).delete()
+                user.delete()
+                # the patches were seeded without signals but deleting them uncounts them, recount the stats
+                refresh_stats()
+
+    def seed(self, user, words, rng, options):
+        """Insert the synthetic patches and blocks in batches and index them"""
+
+        def text(count):
+            return ' '.join(rng.choice(words) for _ in range(count))
+
+        for offset in range(0, options['patches'], options['batch_size']):
+            count = min(options['batch_size'], options['patches'] - offset)
+
+            with transaction.atomic():
+                patches = Patch.objects.bulk_create(
+                    Patch(title=text(4), description=text(20), user=user, state='published') for _ in range(count)
+                )
+                PatchContent.objects.bulk_create(
+                    (PatchContent(post=patch, text=text(30), order=order, type='textField')
+                     for patch in patches for order in range(1, options['blocks'] + 1)),
+                    batch_size=5000,
+                )
+                update_search_vectors([patch.pk for patch in patches])
+
+    def run(self, words, rng, queries):
+        """Request the first page of results for random one and two word searches, returns the timings"""
+
+        factory = APIRequestFactory()
+        view = PatchSearchView.as_view()
+        timings = []
+
+        for i in range(queries):
+            q = ' '.join(rng.sample(words, 1 + i % 2))
+            request = factory.get('/api/patches/search/', {'q': q})
+
+            start = time.perf_counter()
+            response = view(request)
+            response.render()
+            timings.append(time.perf_counter() - start)
+
+            if response.status_code != 200:
+                self.stderr.write(f'Search for "{q}" failed with {response.status_code}')
+
+        return timings
+
+    def report(self, timings):
+        timings = sorted(timing * 1000 for timing in timings)
+        p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) >= 20 else timings[-1]
+
+        self.stdout.write(f'{len(timings)} searches: median {statistics.median(timings):.1f}ms, '
+                          f'p95 {p95:.1f}ms, max {timings[-1]:.1f}ms')
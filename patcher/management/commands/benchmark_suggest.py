@@ -0,0 +1,74 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth import models as auth_models
+from django.db import connection
+
+from patcher.models import Patch
+from patcher.search import suggest
+from patcher.stats import refresh_stats
+
+class Command(BaseCommand):
+    help = 'Compare the latency of trigram suggestions with icontains lookups, one query per keystroke'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patches', type=int, default=100000, help='Number of patches seeded')
+        parser.add_argument('--users', type=int, default=20000, help='Number of users seeded')
+        parser.add_argument('--words', type=int, default=50, help='Number of words typed, one lookup per prefix')
+        parser.add_argument('--limit', type=int, default=5, help='Number of suggestions of each kind')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 9))) for _ in range(5000)]
+        prefix = f'bench-{uuid.uuid4().hex[:8]}-'
+
+        auth_models.User.objects.bulk_create(
+            auth_models.User(username=f'{prefix}{rng.choice(vocabulary)}{i}') for i in range(options['users'])
+        )
+        owner = auth_models.User.objects.filter(username__startswith=prefix).first()
+
+        try:
+            Patch.objects.bulk_create(
+                (Patch(title=' '.join(rng.choice(vocabulary) for _ in range(3)), user=owner, state='published')
+                 for _ in range(options['patches'])),
+                batch_size=5000,
+            )
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE patcher_patch')
+                cursor.execute('ANALYZE auth_user')
+
+            # every prefix of a word from the second letter on, as typed
+            typed = [word[:end] for word in rng.sample(vocabulary, options['words']) for end in range(2, len(word) + 1)]
+
+            trigram = self.run(typed, lambda text: suggest(text, options['limit']))
+            self.report('trigram', trigram)
+
+            icontains = self.run(typed, lambda text: (
+                list(Patch.objects.filter(state='published', title__icontains=text).values_list('uuid', 'title')[:options['limit']]),
+                list(auth_models.User.objects.filter(username__icontains=text).values_list('id', 'username')[:options['limit']]),
+            ))
+            self.report('icontains', icontains)
+        finally:
+            Patch.objects.filter(user__username__startswith=prefix).delete()
+            auth_models.User.objects.filter(username__startswith=prefix).delete()
+            # users and patches were seeded without signals but deleting them uncounts them, recount the stats
+            refresh_stats()
+
+    def run(self, typed, lookup):
+        """Run the lookup for every typed prefix, returns the timings"""
+
+        timings = []
+        for text in typed:
+            start = time.perf_counter()
+            lookup(text)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        return sorted(timings)
+
+    def report(self, name, timings):
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f'{name:<10} {len(timings)} lookups: median {statistics.median(timings):.2f}ms, '
+                          f'p95 {p95:.2f}ms, max {timings[-1]:.2f}ms')
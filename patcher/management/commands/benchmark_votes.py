@@ -0,0 +1,74 @@
+import time
+import threading
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth import models as auth_models
+from django.db import connection
+
+from patcher.models import Patch
+from patcher.votes import VoteBuffer
+
+class Command(BaseCommand):
+    help = 'Compare upvote throughput of Patch.upvote with the write-behind vote buffer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--votes', type=int, default=2000, help='Number of votes cast in each run')
+        parser.add_argument('--threads', type=int, default=8, help='Number of concurrent voters')
+
+    def handle(self, *args, **options):
+        prefix = f'bench-{uuid.uuid4().hex[:8]}-'
+        auth_models.User.objects.bulk_create(
+            auth_models.User(username=f'{prefix}{i}') for i in range(options['votes'])
+        )
+        users = list(auth_models.User.objects.filter(username__startswith=prefix))
+        patch = Patch.objects.create(title='Vote benchmark', user=users[0], state='published')
+
+        try:
+            direct = self.run(users, options['threads'], lambda user: patch.upvote(user))
+            self.report('Patch.upvote', direct, len(users))
+
+            # start from an empty patch again
+            patch.upvoted_by.clear()
+            Patch.objects.filter(pk=patch.pk).update(upvotes=0)
+
+            buffer = VoteBuffer()
+            buffered = self.run(users, options['threads'], lambda user: buffer.add(patch.pk, user.id), buffer.flush)
+            self.report('VoteBuffer', buffered, len(users))
+
+            patch.refresh_from_db()
+            if patch.upvotes != patch.upvoted_by.count():
+                self.stderr.write(f'Counter mismatch: {patch.upvotes} != {patch.upvoted_by.count()}')
+        finally:
+            patch.delete()
+            auth_models.User.objects.filter(username__startswith=prefix).delete()
+
+    def run(self, users, threads, vote, finish=None):
+        """Cast one vote per user from a pool of threads, returns the elapsed time"""
+
+        chunks = [users[i::threads] for i in range(threads)]
+        barrier = threading.Barrier(threads + 1)
+
+        def worker(chunk):
+            barrier.wait()
+            try:
+                for user in chunk:
+                    vote(user)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+        for thread in workers:
+            thread.start()
+
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        if finish:
+            finish()
+
+        return time.perf_counter() - start
+
+    def report(self, name, elapsed, votes):
+        self.stdout.write(f'{name:<14} {votes} votes in {elapsed:.2f}s, {votes / elapsed:.0f} votes/s')
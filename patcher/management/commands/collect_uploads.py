@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from patcher.uploads import collect_upload_sessions
+
+class Command(BaseCommand):
+    help = 'Delete expired resumable uploads and their parts, meant to run periodically'
+
+    def handle(self, *args, **options):
+        removed = collect_upload_sessions()
+        self.stdout.write(f'Removed {removed} upload directories')
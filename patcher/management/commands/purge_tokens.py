@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from patcher.authentication import purge_expired_tokens
+
+class Command(BaseCommand):
+    help = 'Delete the outstanding and blacklisted rows of expired tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Number of tokens deleted by each statement')
+
+    def handle(self, *args, **options):
+        total = 0
+        for deleted in purge_expired_tokens(options['batch_size']):
+            total += deleted
+            self.stdout.write(f'{total} expired tokens purged')
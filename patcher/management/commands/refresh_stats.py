@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from patcher.stats import refresh_stats
+
+class Command(BaseCommand):
+    help = 'Recompute the landing page stats, creating their rows on the first run'
+
+    def handle(self, *args, **options):
+        for key, value in refresh_stats().items():
+            self.stdout.write(f'{key:<18} {value}')
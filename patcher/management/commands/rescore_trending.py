@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from patcher.ranking import rescore_patches
+
+class Command(BaseCommand):
+    help = 'Recompute the stored trending score of every patch in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of patches updated by each statement')
+
+    def handle(self, *args, **options):
+        total = 0
+        for written in rescore_patches(options['batch_size']):
+            total += written
+            self.stdout.write(f'{total} patches rescored')
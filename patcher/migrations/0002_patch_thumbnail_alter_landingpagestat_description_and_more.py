@@ -0,0 +1,56 @@
+# Generated by Django 5.0.6 on 2026-10-17 16:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patcher', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patch',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='thumbnails/'),
+        ),
+        migrations.AlterField(
+            model_name='landingpagestat',
+            name='description',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='patch',
+            name='title',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='patch',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='patch',
+            name='version',
+            field=models.CharField(blank=True, default='1.0.0', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='patchcontent',
+            name='post',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='content', to='patcher.patch'),
+        ),
+        migrations.AlterField(
+            model_name='patchcontent',
+            name='type',
+            field=models.TextField(choices=[('textField', 'Text Field'), ('singleImage', 'Single Image'), ('imageGallery', 'Image Gallery')], default='textField', max_length=15),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='user',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-17 16:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patcher', '0002_patch_thumbnail_alter_landingpagestat_description_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patch',
+            index=models.Index(condition=models.Q(('state', 'published')), fields=['created', 'uuid'], name='patch_pub_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patch',
+            index=models.Index(condition=models.Q(('state', 'published')), fields=['upvotes', 'uuid'], name='patch_pub_upvotes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patch',
+            index=models.Index(fields=['user', 'created'], name='patch_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patchcontent',
+            index=models.Index(fields=['post', 'order'], name='content_post_order_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patcher', '0004_profile_updated_landingpagestat_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='landingpagestat',
+            name='key',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-17 17:10
+
+from django.db import migrations, models
+
+# patcher.ranking.hot_score_sql('upvotes', 'created') as of this migration, for the patches which already exist
+BACKFILL_SQL = """
+UPDATE patcher_patch SET trending =
+    (LOG(GREATEST(upvotes, 1)) + EXTRACT(EPOCH FROM created - TIMESTAMPTZ '2024-01-01T00:00:00+00:00') / 45000)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patcher', '0005_landingpagestat_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patch',
+            name='trending',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='patch',
+            index=models.Index(condition=models.Q(('state', 'published')), fields=['trending', 'uuid'], name='patch_pub_trending_idx'),
+        ),
+    ]
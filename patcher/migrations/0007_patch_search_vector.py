@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-17 17:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# same expression as patcher.search.build_search_vector, for the patches which already exist
+BACKFILL_SQL = """
+UPDATE patcher_patch SET search_vector =
+    setweight(to_tsvector('english', COALESCE(title, '')), 'A')
+    || setweight(to_tsvector('english', COALESCE(description, '')), 'B')
+    || setweight(to_tsvector('english', COALESCE(
+        (SELECT STRING_AGG(text, ' ') FROM patcher_patchcontent WHERE post_id = patcher_patch.uuid), ''
+    )), 'C')
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patcher', '0006_patch_trending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patch',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='patch',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='patch_search_idx'),
+        ),
+    ]
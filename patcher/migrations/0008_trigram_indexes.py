@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-17 17:50
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patcher', '0007_patch_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='patch',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(('state', 'published')), fields=['title'], name='patch_pub_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        # auth_user belongs to django.contrib.auth, so its index is created here
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS auth_user_username_trgm_idx ON auth_user USING gin (username gin_trgm_ops)',
+            'DROP INDEX IF EXISTS auth_user_username_trgm_idx',
+        ),
+    ]
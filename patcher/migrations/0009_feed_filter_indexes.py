@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patcher', '0008_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patch',
+            index=models.Index(condition=models.Q(('state', 'published')), fields=['version', 'created'], name='patch_pub_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patch',
+            index=models.Index(condition=models.Q(('state', 'published'), ('thumbnail__gt', '')), fields=['created', 'uuid'], name='patch_pub_thumbnail_idx'),
+        ),
+    ]
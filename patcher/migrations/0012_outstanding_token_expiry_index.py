@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patcher', '0011_uploadsession'),
+        ('token_blacklist', '0001_initial'),
+    ]
+
+    operations = [
+        # the table belongs to simplejwt's token_blacklist app, so its index is created here
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS token_outstanding_expires_idx ON token_blacklist_outstandingtoken (expires_at)',
+            'DROP INDEX IF EXISTS token_outstanding_expires_idx',
+        ),
+    ]
@@ -1,7 +1,11 @@
 import uuid
 from django.db import models
+from django.utils import timezone
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth import models as auth_models
+from .ranking import hot_score
 
 class Patch(models.Model):
     """Patch model"""
@@ -15,6 +19,12 @@ class Patch(models.Model):
     updated = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(auth_models.User, null=True, blank=True, on_delete=models.CASCADE)
     upvotes = models.IntegerField(default=0)
+    # hot ranking score kept in step with upvotes, see patcher.ranking
+    trending = models.FloatField(default=0)
+    # title, description and content blocks, maintained by patcher.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    # resized copies of the thumbnail, written by patcher.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     upvoted_by = models.ManyToManyField(auth_models.User, related_name='upvoted_patches', blank=True)
 
     STATE_CHOICES = [
@@ -27,28 +37,88 @@ class Patch(models.Model):
 
     class Meta:
         ordering = ['created']
+        indexes = [
+            # published feed, sorted by date or votes with uuid as the keyset tiebreaker
+            models.Index(fields=['created', 'uuid'], condition=models.Q(state='published'), name='patch_pub_created_idx'),
+            models.Index(fields=['upvotes', 'uuid'], condition=models.Q(state='published'), name='patch_pub_upvotes_idx'),
+            models.Index(fields=['trending', 'uuid'], condition=models.Q(state='published'), name='patch_pub_trending_idx'),
+            # feed filters, see patcher.filters
+            models.Index(fields=['version', 'created'], condition=models.Q(state='published'), name='patch_pub_version_idx'),
+            models.Index(fields=['created', 'uuid'], condition=models.Q(state='published', thumbnail__gt=''), name='patch_pub_thumbnail_idx'),
+            # patches of a single user, sorted by date
+            models.Index(fields=['user', 'created'], name='patch_user_created_idx'),
+            GinIndex(fields=['search_vector'], name='patch_search_idx'),
+            # typeahead over published titles, see patcher.search.suggest
+            GinIndex(fields=['title'], opclasses=['gin_trgm_ops'], condition=models.Q(state='published'), name='patch_pub_title_trgm_idx'),
+        ]
 
     def __str__(self):
         return str(self.title)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the stored state tells which saves publish or unpublish the patch, see patcher.signals
+        if 'state' in instance.__dict__:
+            instance._saved_state = instance.state
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if (fields is None or 'state' in fields) and 'state' in self.__dict__:
+            self._saved_state = self.state
+
+    def get_saved_state(self):
+        """Method to return the state stored in the database before this save, None for a new patch"""
+
+        if self._state.adding:
+            return None
+        if hasattr(self, '_saved_state'):
+            return self._saved_state
+
+        # loaded with the state deferred
+        return Patch.objects.filter(pk=self.pk).values_list('state', flat=True).first()
+
     def save(self, *args, **kwargs):
         if not self.user:
             raise ValueError('Creator must be set')
         if not self.upvotes:
             self.upvotes = 0
 
+        # a save limited to other columns leaves the stored counters alone
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'upvotes' in update_fields:
+            self.trending = hot_score(self.upvotes, self.created or timezone.now())
+
+        if update_fields is None or 'state' in update_fields:
+            self._previous_state = self.get_saved_state()
+
         super(Patch, self).save(*args, **kwargs)
 
+        if update_fields is None or 'state' in update_fields:
+            self._saved_state = self.state
+
     def upvote(self, user):
         """Method to upvote a patch"""
+        from .votes import add_upvote
 
-        if not self.upvoted_by.through.objects.filter(patch_id=self.uuid, user_id=user.id).exists():
-            self.upvotes = self.upvotes + 1
-            self.upvoted_by.add(user)
-            self.save()
-            return True
+        result = add_upvote(self.uuid, user.id)
+        if result is None:
+            raise Patch.DoesNotExist('Patch no longer exists')
 
-        return False
+        upvoted, self.upvotes = result
+        return upvoted
+
+    def remove_upvote(self, user):
+        """Method to withdraw an upvote from a patch"""
+        from .votes import remove_upvote
+
+        result = remove_upvote(self.uuid, user.id)
+        if result is None:
+            raise Patch.DoesNotExist('Patch no longer exists')
+
+        removed, self.upvotes = result
+        return removed
 
 class PatchContent(models.Model):
     """Model to store content for patches"""
@@ -57,6 +127,8 @@ class PatchContent(models.Model):
     text = models.TextField(max_length=500, blank=True, null=True, default='')
     images = ArrayField(models.ImageField(upload_to='images/'), blank=True, null=True, default=list)
     order = models.IntegerField()
+    # resized copies of the images, written by patcher.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     TYPE_CHOICES = [
         ('textField', 'Text Field'),
@@ -66,26 +138,43 @@ class PatchContent(models.Model):
 
     type = models.TextField(max_length=15, choices=TYPE_CHOICES, blank=False, default='textField')
 
-    def save(self, *args, **kwargs):
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'order'], name='content_post_order_idx'),
+        ]
+
+    def check_invariants(self):
+        """Method to apply defaults and validate the block, also used for bulk inserts which skip save()"""
+
+        images = self.images or []
 
         if not self.order:
             self.order = 1
-        if not self.post:
+        if not self.post_id:
             raise ValueError("Post must be set")
-        if self.type == 'singleImage' and len(self.images) > 1:
+        if self.type == 'singleImage' and len(images) > 1:
             raise ValueError("Single Image content type can only have one image")
-        if self.type == 'singleImage' or self.type == 'imageGallery' and len(self.images) == 0:
+        if self.type in ('singleImage', 'imageGallery') and len(images) == 0:
             raise ValueError("Image content type must have at least one image")
-        if self.type == 'textField' and len(self.images) > 0:
+        if self.type == 'textField' and len(images) > 0:
             raise ValueError("Text content type cannot have images")
 
+    def save(self, *args, **kwargs):
+        from .search import update_search_vectors
+
+        self.check_invariants()
+
         super(PatchContent, self).save(*args, **kwargs)
+        update_search_vectors([self.post_id])
 
 class LandingPageStat(models.Model):
     """Model to store statistics for the landing page"""
 
     value = models.IntegerField()
     description = models.CharField(max_length=100)
+    updated = models.DateTimeField(auto_now=True)
+    # set on the rows maintained by patcher.stats, hand-entered rows leave it empty
+    key = models.CharField(max_length=50, unique=True, null=True, blank=True)
 
     class Meta:
         ordering = ['description']
@@ -93,7 +182,7 @@ class LandingPageStat(models.Model):
     def save(self, *args, **kwargs):
         if not self.description:
             raise ValueError('Description must be set')
-        if not self.value:
+        if self.value is None:
             raise ValueError('Value must be set')
 
         super(LandingPageStat, self).save(*args, **kwargs)
@@ -111,6 +200,9 @@ class Profile(models.Model):
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True, default='avatars/default.svg')
     bio = models.TextField(max_length=250, blank=True)
     joined = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    # resized copies of the avatar, written by patcher.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return str(self.user.username) if self.user else ''
@@ -120,6 +212,24 @@ class Profile(models.Model):
 
         return f"We don't know much about them, but we're sure {self.user.username} is great."
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_values = instance.get_field_values()
+        return instance
+
+    def get_field_values(self):
+        """Method to return the loaded field values, in their serialized form"""
+
+        deferred = self.get_deferred_fields()
+        return {field.attname: field.value_to_string(self) for field in self._meta.concrete_fields if field.attname not in deferred}
+
+    def get_changed_fields(self):
+        """Method to return the fields changed since the profile was loaded or saved"""
+
+        saved = getattr(self, '_saved_values', {})
+        return [name for name, value in self.get_field_values().items() if saved.get(name) != value]
+
     def save(self, *args, **kwargs):
         if not self.user:
             raise ValueError('User must be set')
@@ -127,3 +237,22 @@ class Profile(models.Model):
             self.bio = self.get_default_bio()
 
         super(Profile, self).save(*args, **kwargs)
+        self._saved_values = self.get_field_values()
+
+class UploadSession(models.Model):
+    """Model to store resumable uploads, the received parts are kept on disk by patcher.uploads"""
+
+    id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
+    user = models.ForeignKey(auth_models.User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires'], name='upload_session_expires_idx'),
+        ]
+
+    def __str__(self):
+        return str(self.filename)
@@ -1,15 +1,215 @@
+import base64
+import binascii
+import datetime
+import json
+from uuid import UUID
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+class AsyncPaginationMixin:
+    """Pagination mixin adding apaginate_queryset, which counts and loads the page with the async ORM"""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # count is a cached property, filled in so the paginator runs no query of its own
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg) from exc
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        self.request = request
+        self.page.object_list = [obj async for obj in self.page.object_list.aiterator(chunk_size=page_size)]
+        return list(self.page)
 
-class PatchPagination(PageNumberPagination):
+class AsyncPageNumberPagination(AsyncPaginationMixin, PageNumberPagination):
+    """PageNumberPagination for the async views"""
+
+class PatchPagination(AsyncPaginationMixin, PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 50
 
+    # keyset pagination, selected per request with ?pagination=cursor or ?cursor=<token>
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    # fields which can be used as the first part of the (field, uuid) key
+    cursor_fields = {
+        'created': datetime.datetime.fromisoformat,
+        'upvotes': int,
+        'trending': float,
+    }
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_cursor_mode(self, request):
+        """Method to check if the client asked for keyset pagination"""
+
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or self.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.is_cursor_mode(request)
+
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        return self.paginate_queryset_by_cursor(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.is_cursor_mode(request)
+
+        if not self.cursor_mode:
+            return await super().apaginate_queryset(queryset, request, view)
+
+        queryset, page_size = self.get_cursor_queryset(queryset, request, view)
+        results = [obj async for obj in queryset[:page_size + 1].aiterator(chunk_size=page_size + 1)]
+        return self.get_cursor_page(results, page_size)
+
     def get_paginated_response(self, data):
+        if self.cursor_mode:
+            return Response({
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link(),
+                'results': data,
+            })
+
         return Response({
             'count': self.page.paginator.count,
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'results': data,
-        })
\ No newline at end of file
+        })
+
+    def get_next_link(self):
+        if self.cursor_mode:
+            return self.get_cursor_link(self.next_cursor)
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.cursor_mode:
+            return self.get_cursor_link(self.previous_cursor)
+        return super().get_previous_link()
+
+    def get_ordering(self, request, view):
+        """Method to resolve the (field, descending) pair used as the keyset"""
+
+        ordering = request.query_params.get(self.ordering_query_param) or getattr(view, 'ordering', '-created')
+        descending = ordering.startswith('-')
+        field = ordering.lstrip('-')
+
+        allowed = getattr(view, 'ordering_fields', None) or list(self.cursor_fields)
+        if ',' in ordering or field not in self.cursor_fields or field not in allowed:
+            raise NotFound(f'Cursor pagination is not supported for ordering "{ordering}"')
+
+        return field, descending
+
+    def encode_cursor(self, instance, reverse):
+        """Method to encode the position just after the given instance"""
+
+        value = getattr(instance, self.field)
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+
+        payload = json.dumps({'o': self.ordering, 'v': value, 'u': str(instance.uuid), 'r': reverse})
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        """Method to decode the cursor passed in the request"""
+
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+
+        try:
+            padding = '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode((token + padding).encode()))
+            if payload['o'] != self.ordering:
+                raise ValueError('Cursor was created for another ordering')
+
+            value = self.cursor_fields[self.field](payload['v'])
+            return value, UUID(payload['u']), bool(payload['r'])
+        except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+            raise NotFound(self.invalid_cursor_message) from exc
+
+    def paginate_queryset_by_cursor(self, queryset, request, view=None):
+        """Method to return a page following the (field, uuid) keyset"""
+
+        queryset, page_size = self.get_cursor_queryset(queryset, request, view)
+        return self.get_cursor_page(list(queryset[:page_size + 1]), page_size)
+
+    def get_cursor_queryset(self, queryset, request, view=None):
+        """Method to order and bound the queryset by the keyset, returns it with the page size"""
+
+        page_size = self.get_page_size(request)
+        self.request = request
+        self.field, descending = self.get_ordering(request, view)
+        self.ordering = ('-' if descending else '') + self.field
+
+        cursor = self.decode_cursor(request)
+        self.cursor = cursor
+        reverse = bool(cursor and cursor[2])
+
+        # walking backwards flips both the sort and the comparison
+        backwards = descending != reverse
+        prefix = '-' if backwards else ''
+        queryset = queryset.order_by(prefix + self.field, prefix + 'uuid')
+
+        if cursor:
+            value, uuid, _ = cursor
+            lookup = 'lt' if backwards else 'gt'
+            # the leading range condition on the field lets the (field, uuid) index bound the scan
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}e': value}),
+                Q(**{f'{self.field}__{lookup}': value}) | Q(**{f'uuid__{lookup}': uuid}),
+            )
+
+        return queryset, page_size
+
+    def get_cursor_page(self, results, page_size):
+        """Method to build the page and its cursors from the rows loaded for it, one more than the page size"""
+
+        cursor = self.cursor
+        reverse = bool(cursor and cursor[2])
+
+        has_more = len(results) > page_size
+        results = results[:page_size]
+
+        if reverse:
+            results.reverse()
+
+        # the link in the walking direction exists only if more rows were found,
+        # the link back exists whenever we did not start from the first page
+        has_next = has_more if not reverse else bool(cursor)
+        has_previous = has_more if reverse else bool(cursor)
+
+        self.next_cursor = self.encode_cursor(results[-1], False) if results and has_next else None
+        self.previous_cursor = self.encode_cursor(results[0], True) if results and has_previous else None
+
+        return results
+
+    def get_cursor_link(self, cursor):
+        """Method to build an absolute link to the page at the given cursor"""
+
+        if cursor is None:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        url = replace_query_param(url, self.mode_query_param, 'cursor')
+        return replace_query_param(url, self.cursor_query_param, cursor)
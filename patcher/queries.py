@@ -0,0 +1,118 @@
+from django.db.models import Prefetch
+from django.contrib.auth import models as auth_models
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+class QueryPlanMixin:
+    """Serializer mixin declaring the relations a serializer needs loaded in bulk"""
+
+    # relations followed with a JOIN (foreign keys, one-to-one)
+    select_related_fields = []
+    # relations loaded with one extra query per page (many-to-many, reverse foreign keys)
+    prefetch_related_fields = []
+
+    @classmethod
+    def get_prefetch(cls, field):
+        """Method to build the prefetch lookup for a relation, override to narrow its queryset"""
+
+        return field
+
+    @classmethod
+    def is_field_requested(cls, field, request=None, many=False):
+        """Method to check if a field will be serialized for the request"""
+
+        return True
+
+    @classmethod
+    def plan_queryset(cls, queryset, request=None, many=False):
+        """Method to apply the serializer's query plan to a queryset, many is set for list endpoints"""
+
+        select_related = [field for field in cls.select_related_fields if cls.is_field_requested(field, request, many)]
+        prefetch_related = [field for field in cls.prefetch_related_fields if cls.is_field_requested(field, request, many)]
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*[cls.get_prefetch(field) for field in prefetch_related])
+
+        return queryset
+
+class SparseFieldsMixin(QueryPlanMixin):
+    """
+    Serializer mixin limiting the serialized fields with ?fields= and ?omit=.
+
+    Both take a comma separated list of field names, nested names such as user.username
+    select their top level field. Only the columns of the requested fields are loaded.
+    Fields in list_omit_fields are left out of lists unless requested with ?fields=.
+    """
+
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+    list_omit_fields = []
+    # serializer fields which read other model fields, such as computed fields with source='*'
+    field_sources = {}
+
+    @classmethod
+    def get_sparse_fields(cls, request):
+        """Method to return the (requested, omitted) field names, requested is None when not limited"""
+
+        if request is None or request.method not in SAFE_METHODS:
+            return None, set()
+
+        def parse(param):
+            value = request.query_params.get(param)
+            if value is None:
+                return None
+            return {name.strip().split('.')[0] for name in value.split(',') if name.strip()}
+
+        return parse(cls.fields_query_param), parse(cls.omit_query_param) or set()
+
+    @classmethod
+    def is_field_requested(cls, field, request=None, many=False):
+        requested, omitted = cls.get_sparse_fields(request)
+
+        if field in omitted:
+            return False
+        if requested is not None:
+            return field in requested
+        return not (many and field in cls.list_omit_fields)
+
+    @classmethod
+    def plan_queryset(cls, queryset, request=None, many=False):
+        queryset = super().plan_queryset(queryset, request, many)
+
+        requested, omitted = cls.get_sparse_fields(request)
+        if requested is None and not omitted:
+            return queryset
+
+        # keep the ordering columns, the cursor pagination reads them from the last row
+        ordering = {field.lstrip('-') for field in queryset.query.order_by if isinstance(field, str)}
+
+        sources = {
+            source for name, fields in cls.field_sources.items()
+            if cls.is_field_requested(name, request, many) for source in fields
+        }
+
+        only = [
+            field.name for field in cls.Meta.model._meta.concrete_fields
+            if field.primary_key or field.name in ordering or field.name in sources
+            or cls.is_field_requested(field.name, request, many)
+        ]
+        return queryset.only(*only)
+
+    def get_fields(self):
+        fields = super().get_fields()
+
+        # only the top level serializer follows the query parameters, not nested ones
+        if self.root is not self and self.root is not self.parent:
+            return fields
+
+        request = self.context.get('request')
+        many = isinstance(self.parent, serializers.ListSerializer)
+        return {name: field for name, field in fields.items() if self.is_field_requested(name, request, many)}
+
+def prefetch_user_ids(field):
+    """Build a prefetch for a user relation which is only serialized as a list of ids"""
+
+    return Prefetch(field, queryset=auth_models.User.objects.only('id'))
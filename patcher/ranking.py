@@ -0,0 +1,66 @@
+import datetime
+import math
+
+from django.db import connection
+
+# Hot ranking: log10 of the upvotes plus the age term. Every HOT_DECAY seconds of age
+# cost as much as a tenfold upvote lead, so old popular patches sink below new ones.
+# Scores of different patches only move relative to each other when they get votes,
+# so the stored column needs no time-based recomputation to stay correctly ordered.
+HOT_EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+HOT_DECAY = 45000
+
+def hot_score(upvotes, created):
+    """Return the trending score of a patch"""
+
+    return math.log10(max(upvotes, 1)) + (created - HOT_EPOCH).total_seconds() / HOT_DECAY
+
+def hot_score_sql(upvotes, created):
+    """Return the SQL expression computing the trending score from the given column expressions"""
+
+    return (f"(LOG(GREATEST({upvotes}, 1)) + EXTRACT(EPOCH FROM {created} - "
+            f"TIMESTAMPTZ '{HOT_EPOCH.isoformat()}') / {HOT_DECAY})")
+
+RESCORE_SQL = """
+WITH batch AS (
+    SELECT {patch_pk} AS pk FROM {patch_table}
+    WHERE {patch_pk} > %(after)s
+    ORDER BY {patch_pk}
+    LIMIT %(limit)s
+)
+UPDATE {patch_table}
+SET trending = {score}
+FROM batch
+WHERE {patch_pk} = batch.pk
+RETURNING {patch_pk}
+"""
+
+def rescore_patches(batch_size=1000):
+    """
+    Recompute the stored trending score of every patch, one UPDATE per batch of primary keys.
+
+    Yields the number of patches written by each batch.
+    """
+
+    from .models import Patch
+
+    quote = connection.ops.quote_name
+    patch_table = quote(Patch._meta.db_table)
+    patch_pk = f'{patch_table}.{quote(Patch._meta.pk.column)}'
+    sql = RESCORE_SQL.format(
+        patch_table=patch_table,
+        patch_pk=patch_pk,
+        score=hot_score_sql(f'{patch_table}.upvotes', f'{patch_table}.created'),
+    )
+
+    after = '00000000-0000-0000-0000-000000000000'
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'after': after, 'limit': batch_size})
+            rows = cursor.fetchall()
+
+        if not rows:
+            return
+
+        after = max(row[0] for row in rows)
+        yield len(rows)
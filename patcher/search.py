@@ -0,0 +1,74 @@
+from django.contrib.auth import models as auth_models
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db.models import CharField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce
+
+from .models import Patch
+from .models import PatchContent
+
+SEARCH_CONFIG = 'english'
+
+# shorter prefixes share too few trigrams with the words they start
+SUGGESTION_MIN_LENGTH = 2
+
+def build_search_vector():
+    """Build the expression of a patch's search vector, the title weighs most and the content blocks least"""
+
+    content = (PatchContent.objects.filter(post=OuterRef('pk'))
+               .order_by()
+               .values('post')
+               .annotate(text=StringAgg('text', ' '))
+               .values('text'))
+
+    return (SearchVector('title', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+            + SearchVector(Coalesce(Subquery(content), Value('')), weight='C', config=SEARCH_CONFIG))
+
+def update_search_vectors(patch_ids):
+    """Recompute the stored search vector of the given patches with a single UPDATE"""
+
+    return Patch.objects.filter(pk__in=patch_ids).update(search_vector=build_search_vector())
+
+def search_patches(queryset, text):
+    """Filter the queryset to the patches matching the search text, best matches first"""
+
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+
+    return (queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', '-created', 'uuid'))
+
+def suggest(text, limit):
+    """
+    Return the published patch titles and usernames closest to the typed text.
+
+    Both lookups use the %> operator backed by their trigram GIN indexes and run as one
+    UNION ALL query. Returns a {'patches': [...], 'users': [...]} dict with at most limit
+    entries each, best matches first.
+    """
+
+    suggestions = {'patches': [], 'users': []}
+    if len(text) < SUGGESTION_MIN_LENGTH:
+        return suggestions
+
+    columns = ['kind', 'key', 'label', 'score']
+
+    patches = (Patch.objects.filter(state='published', title__trigram_word_similar=text)
+               .annotate(kind=Value('patch'), key=Cast('uuid', CharField()), label=F('title'),
+                         score=TrigramWordSimilarity(text, 'title'))
+               .order_by('-score')
+               .values_list(*columns)[:limit])
+    users = (auth_models.User.objects.filter(is_active=True, username__trigram_word_similar=text)
+             .annotate(kind=Value('user'), key=Cast('id', CharField()), label=F('username'),
+                       score=TrigramWordSimilarity(text, 'username'))
+             .order_by('-score')
+             .values_list(*columns)[:limit])
+
+    for kind, key, label, score in sorted(patches.union(users, all=True), key=lambda row: -row[3]):
+        if kind == 'patch':
+            suggestions['patches'].append({'uuid': key, 'title': label})
+        else:
+            suggestions['users'].append({'id': int(key), 'username': label})
+
+    return suggestions
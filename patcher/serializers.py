@@ -1,14 +1,58 @@
 import logging
-import json
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
 from django.contrib.auth import models as auth_models
 from .models import Patch
 from .models import PatchContent
 from .models import LandingPageStat
 from .models import Profile
+from .queries import SparseFieldsMixin
+from .queries import prefetch_user_ids
+from .votes import vote_buffer
+from .images import get_image_names
+from .content import parse_content
+from .content import build_blocks
+from .content import create_blocks
+from .content import diff_blocks
+from .content import apply_blocks_diff
+from .authentication import CachedRefreshToken
 
 logger = logging.getLogger(__name__)
 
+class SrcsetField(serializers.Field):
+    """
+    Read only field with the resized derivatives of an image field, as {format: {width: url}}.
+
+    None until the image pipeline has processed the image, image arrays give a list of maps.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def get_srcset(self, derivatives):
+        if not derivatives:
+            return None
+        return {fmt: {width: self.get_url(name) for width, name in widths.items()} for fmt, widths in derivatives.items()}
+
+    def to_representation(self, instance):
+        derivatives = instance.image_derivatives or {}
+        srcsets = [self.get_srcset(derivatives.get(name)) for name in get_image_names(instance, self.image_field)]
+
+        if isinstance(getattr(instance, self.image_field), (list, tuple)):
+            return srcsets
+        return srcsets[0] if srcsets else None
+
 class LandingPageStatSerializer(serializers.ModelSerializer):
     """Model Serializer for LandingPageStat model"""
     class Meta:
@@ -24,14 +68,20 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['username', 'email', 'password']
 
     def create(self, validated_data):
-        user = auth_models.User.objects.create_user(
-            username = validated_data['username'],
-            email = validated_data['email'],
-            password = validated_data['password']
-        )
+        # the profile and the user count are written by the post_save signals, in the same transaction
+        with transaction.atomic():
+            user = auth_models.User.objects.create_user(
+                username = validated_data['username'],
+                email = validated_data['email'],
+                password = validated_data['password']
+            )
 
         return user
 
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh serializer checking the blacklist through the cache"""
+    token_class = CachedRefreshToken
+
 class UserDetailSerializer(serializers.ModelSerializer):
     """Model Serializer for User model"""
     class Meta:
@@ -42,83 +92,143 @@ class ProfileSerializer(serializers.ModelSerializer):
     """Model Serializer for Profile model"""
     username = serializers.CharField(source='user.username', read_only=True)
     avatar = serializers.ImageField(max_length=None, use_url=True, required=False)
+    avatar_srcset = SrcsetField('avatar')
     bio = serializers.CharField(max_length=250, allow_blank=True, required=False)
     joined = serializers.DateTimeField(read_only=True, required=False)
 
     class Meta:
         model = Profile
-        fields = ['id', 'username', 'avatar', 'bio', 'joined']
+        fields = ['id', 'username', 'avatar', 'avatar_srcset', 'bio', 'joined']
         read_only_fields = ['id', 'joined']
 
-class PatchContentSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(serializers.ModelSerializer):
+    """Model Serializer for User model with its profile, for lists of authors"""
+    profile = ProfileSerializer(read_only=True)
+
+    class Meta:
+        model = auth_models.User
+        fields = ['id', 'username', 'profile']
+
+class PatchContentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Model Serializer for PatchContent model"""
+    images_srcset = SrcsetField('images')
+
+    field_sources = {'images_srcset': ['images', 'image_derivatives']}
+
     class Meta:
         model = PatchContent
-        fields = "__all__"
+        exclude = ['image_derivatives']
+
+# columns written by PatchSerializer.update
+PATCH_HEADER_FIELDS = ['title', 'description', 'thumbnail', 'version', 'state', 'updated']
 
-class PatchSerializer(serializers.ModelSerializer):
+class PatchSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Model Serializer for Patch model"""
     user = UserDetailSerializer(read_only=True)
+    viewer_has_upvoted = serializers.SerializerMethodField()
+    thumbnail_srcset = SrcsetField('thumbnail')
+
+    field_sources = {'thumbnail_srcset': ['thumbnail', 'image_derivatives']}
+    select_related_fields = ['user']
+    prefetch_related_fields = ['upvoted_by']
+    # grows with the popularity of a patch, viewer_has_upvoted covers what lists need
+    list_omit_fields = ['upvoted_by']
 
     class Meta:
         model = Patch
-        fields = "__all__"
-        read_only_fields = ['created', 'user', 'uuid']
+        exclude = ['search_vector', 'image_derivatives']
+        read_only_fields = ['created', 'user', 'uuid', 'trending']
 
-    def create(self, validated_data):
-        try:
-            content_data = json.loads(self.initial_data.get('content'))
-        except json.JSONDecodeError as exc:
-            raise serializers.ValidationError("Content's JSON is invalid", code='invalid') from exc
-        except TypeError as exc:
-            raise serializers.ValidationError("Content must be a JSON array", code='invalid') from exc
+    @classmethod
+    def get_prefetch(cls, field):
+        if field == 'upvoted_by':
+            return prefetch_user_ids(field)
+        return field
+
+    @classmethod
+    def plan_queryset(cls, queryset, request=None, many=False):
+        queryset = super().plan_queryset(queryset, request, many).defer('search_vector')
 
-        patch = Patch.objects.create(**validated_data)
+        # resolve the flag for the whole page with one EXISTS subquery
+        if request is not None and request.user.is_authenticated and cls.is_field_requested('viewer_has_upvoted', request, many):
+            upvotes = Patch.upvoted_by.through.objects.filter(patch_id=OuterRef('pk'), user_id=request.user.id)
+            queryset = queryset.annotate(viewer_has_upvoted=Exists(upvotes))
 
-        for content in content_data:
-            content["post"] = patch.uuid
-            content = PatchContentSerializer(data=content)
+        return queryset
 
-            if content.is_valid():
-                content.save()
-            else:
-                patch.delete()
-                logger.error('Validation errors: %s, %s', content.errors, content.initial_data)
-                raise serializers.ValidationError(content.errors)
+    def get_viewer_has_upvoted(self, obj):
+        """Method to check if the requesting user has upvoted the patch"""
+
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return False
+
+        if vote_buffer.enabled and vote_buffer.is_pending(obj.pk, request.user.id):
+            return True
+
+        if hasattr(obj, 'viewer_has_upvoted'):
+            return obj.viewer_has_upvoted
+
+        return Patch.upvoted_by.through.objects.filter(patch_id=obj.pk, user_id=request.user.id).exists()
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+
+        # include upvotes which are still waiting in the vote buffer
+        if 'upvotes' in data and vote_buffer.enabled:
+            data['upvotes'] += vote_buffer.pending_count(instance.pk)
+
+        return data
+
+    def create(self, validated_data):
+        content_data = parse_content(self.initial_data)
+
+        try:
+            # validate every block before anything is written
+            blocks = build_blocks(content_data)
+
+            with transaction.atomic():
+                patch = Patch.objects.create(**validated_data)
+                create_blocks(patch, blocks)
+        except serializers.ValidationError as exc:
+            logger.error('Validation errors: %s, %s', exc.detail, content_data)
+            raise
 
         return patch
 
     def update(self, instance, validated_data):
-        instance.title = validated_data.get('title', instance.title)
-        instance.description = validated_data.get('description', instance.description)
-        instance.thumbnail = validated_data.get('thumbnail', instance.thumbnail)
-        instance.version = validated_data.get('version', instance.version)
-        instance.state = validated_data.get('state', instance.state)
-        instance.save()
-
-        if 'content' in self.initial_data:
-            try:
-                content_data = json.loads(self.initial_data.get('content'))
-            except json.JSONDecodeError as exc:
-                raise serializers.ValidationError("Content's JSON is invalid", code='invalid') from exc
-            except TypeError as exc:
-                raise serializers.ValidationError("Content must be a JSON array", code='invalid') from exc
-
-            for content in content_data:
-                content_id = content.get('id', None)
-
-                if content_id:
-                    try:
-                        content_instance = PatchContent.objects.get(id=content_id)
-                    except PatchContent.DoesNotExist as exc:
-                        raise serializers.ValidationError("Content ID does not exist", code='invalid') from exc
-
-                    content_instance.type = content.get('type', content_instance.type)
-                    content_instance.order = content.get('order', content_instance.order)
-                    content_instance.text = content.get('text', content_instance.text)
-                    content_instance.images = content.get('images', content_instance.images)
-                    content_instance.save()
-                else:
-                    raise serializers.ValidationError("Content ID must be provided", code='invalid')
+        content_data = parse_content(self.initial_data) if 'content' in self.initial_data else None
+
+        with transaction.atomic():
+            # lock the patch so that concurrent updates diff against the blocks they replace, and
+            # reload the columns which votes and other edits may have changed since the instance was loaded
+            instance.upvotes, instance.trending, instance._saved_state = (
+                Patch.objects.select_for_update().filter(pk=instance.pk).values_list('upvotes', 'trending', 'state').get())
+
+            # validate every block before anything is written
+            diff = diff_blocks(instance, content_data) if content_data is not None else None
+
+            instance.title = validated_data.get('title', instance.title)
+            instance.description = validated_data.get('description', instance.description)
+            instance.thumbnail = validated_data.get('thumbnail', instance.thumbnail)
+            instance.version = validated_data.get('version', instance.version)
+            instance.state = validated_data.get('state', instance.state)
+            # votes write the counters with their own statements, only the header is saved
+            instance.save(update_fields=PATCH_HEADER_FIELDS)
+
+            if diff is not None:
+                apply_blocks_diff(instance, diff)
 
         return instance
+
+class PatchDetailSerializer(PatchSerializer):
+    """Model Serializer for Patch model with its content blocks embedded"""
+    content = PatchContentSerializer(many=True, read_only=True)
+
+    prefetch_related_fields = PatchSerializer.prefetch_related_fields + ['content']
+
+    @classmethod
+    def get_prefetch(cls, field):
+        if field == 'content':
+            return Prefetch('content', queryset=PatchContent.objects.order_by('order'))
+        return super().get_prefetch(field)
@@ -1,7 +1,16 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from .models import Profile
+from .models import Patch
+from .models import PatchContent
+from .cache import bump_feed_version
+from .authentication import invalidate_cached_user
+from .stats import adjust_stat
+from .stats import adjust_published
+from .search import update_search_vectors
+from .images import image_pipeline
+from .images import needs_derivatives
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -9,5 +18,79 @@ def create_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+def save_user_profile(sender, instance, created, **kwargs):
+    # only a profile loaded through the user can carry unsaved changes, and only those are written
+    if created or not User.profile.is_cached(instance):
+        return
+
+    changed = instance.profile.get_changed_fields()
+    if changed:
+        instance.profile.save(update_fields=changed + ['updated'])
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile_user(sender, instance, **kwargs):
+    invalidate_cached_user(instance.user_id)
+
+@receiver(post_save, sender=Patch)
+@receiver(post_delete, sender=Patch)
+def invalidate_feed(sender, **kwargs):
+    bump_feed_version()
+
+@receiver(m2m_changed, sender=Patch.upvoted_by.through)
+def invalidate_feed_upvotes(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_feed_version()
+
+@receiver(post_save, sender=User)
+def count_user(sender, instance, created, **kwargs):
+    if created:
+        adjust_stat('registered_users', 1)
+
+@receiver(post_delete, sender=User)
+def uncount_user(sender, instance, **kwargs):
+    adjust_stat('registered_users', -1)
+
+@receiver(post_save, sender=Patch)
+def count_patch(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'state' not in update_fields:
+        return
+
+    # set by Patch.save from the state the patch was loaded with
+    was_published = getattr(instance, '_previous_state', None) == 'published'
+    is_published = instance.state == 'published'
+
+    if was_published != is_published:
+        adjust_published(instance, 1 if is_published else -1)
+
+@receiver(post_delete, sender=Patch)
+def uncount_patch(sender, instance, **kwargs):
+    if instance.state == 'published':
+        adjust_published(instance, -1)
+    adjust_stat('total_upvotes', -instance.upvotes)
+
+@receiver(post_save, sender=Patch)
+def index_patch(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'title', 'description'} & set(update_fields):
+        update_search_vectors([instance.pk])
+
+def queue_derivatives(instance, field, update_fields):
+    if (update_fields is None or field in update_fields) and needs_derivatives(instance, field):
+        image_pipeline.submit(instance, field)
+
+@receiver(post_save, sender=Patch)
+def process_thumbnail(sender, instance, update_fields=None, **kwargs):
+    queue_derivatives(instance, 'thumbnail', update_fields)
+
+@receiver(post_save, sender=PatchContent)
+def process_content_images(sender, instance, update_fields=None, **kwargs):
+    queue_derivatives(instance, 'images', update_fields)
+
+@receiver(post_save, sender=Profile)
+def process_avatar(sender, instance, update_fields=None, **kwargs):
+    queue_derivatives(instance, 'avatar', update_fields)
@@ -0,0 +1,148 @@
+import atexit
+import datetime
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.contrib.auth import models as auth_models
+
+from .models import Patch
+from .models import LandingPageStat
+
+# key -> description of the landing page stats kept up to date from model signals
+STATS = {
+    'published_patches': 'Published patches',
+    'total_upvotes': 'Upvotes given',
+    'registered_users': 'Registered users',
+    'patches_this_week': 'Patches this week',
+}
+
+RECENT_PATCHES_WINDOW = datetime.timedelta(days=7)
+
+logger = logging.getLogger(__name__)
+
+def adjust_stat(key, delta):
+    """Add delta to a running stat with a single UPDATE of its row, does nothing before the stats are seeded"""
+
+    if delta:
+        LandingPageStat.objects.filter(key=key).update(value=F('value') + delta, updated=timezone.now())
+
+class StatBuffer:
+    """
+    In-process buffer of running stat deltas.
+
+    Stats such as total_upvotes change with every vote, updating their row in the vote
+    statement would queue all votes on one row lock. Deltas are summed in memory and
+    applied with one UPDATE per stat every STATS_FLUSH_INTERVAL seconds. Deltas are lost
+    if the process dies before a flush, until refresh_stats recomputes the stats.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> delta waiting for the next flush
+        self.deltas = {}
+        self.flusher = None
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'STATS_FLUSH_INTERVAL', 2)
+
+    def add(self, key, delta):
+        """Queue delta for a running stat"""
+
+        if not delta:
+            return
+
+        with self.lock:
+            self.deltas[key] = self.deltas.get(key, 0) + delta
+
+        self.start()
+
+    def flush(self):
+        """Apply the queued deltas, returns the {key: delta} which were applied"""
+
+        with self.lock:
+            deltas, self.deltas = self.deltas, {}
+
+        applied = {}
+        try:
+            for key, delta in deltas.items():
+                adjust_stat(key, delta)
+                applied[key] = delta
+        except Exception:
+            # keep the deltas which were not applied for the next flush
+            with self.lock:
+                for key, delta in deltas.items():
+                    if key not in applied:
+                        self.deltas[key] = self.deltas.get(key, 0) + delta
+            raise
+
+        return applied
+
+    def start(self):
+        """Start the background flusher, a non-positive interval leaves flushing to the caller"""
+
+        if self.flusher is not None or self.flush_interval <= 0:
+            return
+
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self._run, name='stat-buffer-flusher', daemon=True)
+                self.flusher.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing stat deltas failed')
+            finally:
+                connection.close()
+
+stat_buffer = StatBuffer()
+
+def is_recent(patch):
+    """Check if the patch counts towards the patches of this week"""
+
+    return patch.created is not None and patch.created >= timezone.now() - RECENT_PATCHES_WINDOW
+
+def adjust_published(patch, delta):
+    """Count a patch which was published (delta=1) or left the published state (delta=-1)"""
+
+    adjust_stat('published_patches', delta)
+    if is_recent(patch):
+        adjust_stat('patches_this_week', delta)
+
+def compute_stats():
+    """Compute every stat from scratch, this scans the patch and user tables"""
+
+    published = Patch.objects.filter(state='published')
+
+    return {
+        'published_patches': published.count(),
+        'total_upvotes': Patch.objects.aggregate(total=Sum('upvotes'))['total'] or 0,
+        'registered_users': auth_models.User.objects.count(),
+        'patches_this_week': published.filter(created__gte=timezone.now() - RECENT_PATCHES_WINDOW).count(),
+    }
+
+def refresh_stats():
+    """
+    Recompute the stats and write them to their LandingPageStat rows.
+
+    Creates the rows on the first run. Run it periodically (manage.py refresh_stats) to move
+    the weekly window and to correct drift from writes which skip the signals, such as
+    QuerySet.update().
+    """
+
+    stats = compute_stats()
+
+    for key, value in stats.items():
+        LandingPageStat.objects.update_or_create(key=key, defaults={'value': value, 'description': STATS[key]})
+
+    return stats
@@ -1,7 +1,14 @@
-from django.test import TestCase
+import datetime
+import threading
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 
 from patcher.models import Patch, PatchContent, LandingPageStat, Profile
+from patcher.stats import refresh_stats, stat_buffer
+from patcher.ranking import hot_score, rescore_patches
 
 class PatchTestCase(TestCase):
     def setUp(self):
@@ -55,6 +62,109 @@ class PatchTestCase(TestCase):
         self.assertEqual(patch.upvote(self.user1), False)
         self.assertEqual(patch.upvotes, 2)
 
+    def test_remove_upvote(self):
+        patch = Patch.objects.create(
+            title='Test Patch',
+            description='This is a test patch',
+            user=self.author)
+
+        patch.upvote(self.user1)
+        patch.upvote(self.user2)
+
+        self.assertEqual(patch.remove_upvote(self.user1), True)
+        self.assertEqual(patch.upvotes, 1)
+        self.assertEqual(patch.remove_upvote(self.user1), False)
+        self.assertEqual(patch.upvotes, 1)
+        self.assertEqual(list(patch.upvoted_by.all()), [self.user2])
+
+    def test_upvote_single_query(self):
+        patch = Patch.objects.create(
+            title='Test Patch',
+            description='This is a test patch',
+            user=self.author)
+        updated = patch.updated
+
+        with self.assertNumQueries(1):
+            patch.upvote(self.user1)
+
+        patch.refresh_from_db()
+        self.assertEqual(patch.upvotes, 1)
+        self.assertEqual(patch.updated, updated)
+
+    def test_trending_score(self):
+        patch = Patch.objects.create(title='Test Patch', user=self.author, state='published')
+        patch.refresh_from_db()
+        self.assertAlmostEqual(patch.trending, hot_score(0, patch.created), places=3)
+
+        # votes update the score in the same statement
+        for user in [self.user1, self.user2]:
+            patch.upvote(user)
+        patch.refresh_from_db()
+        self.assertAlmostEqual(patch.trending, hot_score(2, patch.created), places=6)
+
+        patch.remove_upvote(self.user1)
+        patch.refresh_from_db()
+        self.assertAlmostEqual(patch.trending, hot_score(1, patch.created), places=6)
+
+    def test_trending_prefers_new_patches(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        # a day of age (86400 / HOT_DECAY, about 1.9 decades) outweighs a tenfold upvote lead
+        self.assertGreater(hot_score(1, now), hot_score(10, now - datetime.timedelta(days=1)))
+        self.assertGreater(hot_score(100, now), hot_score(1, now))
+
+    def test_rescore_patches(self):
+        patches = [Patch.objects.create(title=f'Test Patch {i}', user=self.author) for i in range(5)]
+        Patch.objects.update(trending=0, upvotes=10)
+
+        self.assertEqual(list(rescore_patches(batch_size=2)), [2, 2, 1])
+
+        for patch in patches:
+            patch.refresh_from_db()
+            self.assertAlmostEqual(patch.trending, hot_score(10, patch.created), places=6)
+
+    def test_upvote_deleted_patch(self):
+        patch = Patch.objects.create(
+            title='Test Patch',
+            description='This is a test patch',
+            user=self.author)
+        Patch.objects.filter(uuid=patch.uuid).delete()
+
+        with self.assertRaises(Patch.DoesNotExist):
+            patch.upvote(self.user1)
+        self.assertEqual(Patch.upvoted_by.through.objects.count(), 0)
+
+class PatchUpvoteConcurrencyTestCase(TransactionTestCase):
+    def test_concurrent_upvotes(self):
+        author = User.objects.create_user(username='patch_author', password='12345')
+        users = [User.objects.create_user(username=f'voter{i}', password='12345') for i in range(8)]
+        patch = Patch.objects.create(title='Trending Patch', user=author, state='published')
+
+        barrier = threading.Barrier(len(users) * 2)
+        errors = []
+
+        def vote(user):
+            try:
+                barrier.wait()
+                # every user votes twice from a separate connection, only one vote may count
+                Patch(uuid=patch.uuid, user=author).upvote(user)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=vote, args=(user,)) for user in users * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+        patch.refresh_from_db()
+        self.assertEqual(patch.upvotes, len(users))
+        self.assertEqual(patch.upvotes, patch.upvoted_by.count())
+
 class PatchContentTestCase(TestCase):
     def setUp(self):
         self.author = User.objects.create_user(username='patch_author', password='12345')
@@ -139,6 +249,15 @@ class PatchContentTestCase(TestCase):
                 images=['image1.jpg', 'image2.jpg'],
                 order=1)
     
+    def test_create_patch_content_single_image_valid(self):
+        content = PatchContent.objects.create(
+            post=self.patch,
+            type='singleImage',
+            images=['image1.jpg'],
+            order=1)
+
+        self.assertEqual(content.images, ['image1.jpg'])
+
     def test_create_patch_content_text_images(self):
         with self.assertRaises(ValueError):
             content = PatchContent.objects.create(
@@ -185,6 +304,92 @@ class LandingPageStatTestCase(TestCase):
         self.assertEqual(stats[1], stat2)
         self.assertEqual(stats[2], stat3)
 
+@override_settings(STATS_FLUSH_INTERVAL=0)
+class LandingPageStatsEngineTestCase(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='patch_author', password='12345')
+        refresh_stats()
+        stat_buffer.deltas.clear()
+
+    def get_stats(self):
+        return dict(LandingPageStat.objects.filter(key__isnull=False).values_list('key', 'value'))
+
+    def test_refresh_stats(self):
+        self.assertEqual(self.get_stats(), {
+            'published_patches': 0,
+            'total_upvotes': 0,
+            'registered_users': 1,
+            'patches_this_week': 0,
+        })
+        self.assertEqual(LandingPageStat.objects.get(key='registered_users').description, 'Registered users')
+
+    def test_stats_follow_patches(self):
+        patch = Patch.objects.create(title='Test Patch', user=self.author, state='draft')
+        self.assertEqual(self.get_stats()['published_patches'], 0)
+
+        patch.state = 'published'
+        patch.save()
+        # saving a published patch again does not count it twice
+        patch.save()
+        self.assertEqual(self.get_stats()['published_patches'], 1)
+        self.assertEqual(self.get_stats()['patches_this_week'], 1)
+
+        # the vote is counted by the next flush, not by the vote statement
+        patch.upvote(self.author)
+        self.assertEqual(self.get_stats()['total_upvotes'], 0)
+        self.assertEqual(stat_buffer.flush(), {'total_upvotes': 1})
+        self.assertEqual(self.get_stats()['total_upvotes'], 1)
+
+        patch.refresh_from_db()
+        patch.delete()
+        self.assertEqual(self.get_stats()['published_patches'], 0)
+        self.assertEqual(self.get_stats()['patches_this_week'], 0)
+        self.assertEqual(self.get_stats()['total_upvotes'], 0)
+
+    def test_stats_follow_loaded_state(self):
+        patch = Patch.objects.create(title='Test Patch', user=self.author, state='draft')
+        patch = Patch.objects.get(pk=patch.pk)
+
+        # the state the patch was loaded with tells a publication apart, without reading it again
+        patch.state = 'published'
+        with CaptureQueriesContext(connection) as queries:
+            patch.save()
+
+        self.assertFalse([query['sql'] for query in queries if query['sql'].startswith('SELECT "patcher_patch"."state"')])
+        self.assertEqual(self.get_stats()['published_patches'], 1)
+
+        # header saves leave the count alone
+        patch.title = 'Renamed Patch'
+        patch.save(update_fields=['title', 'updated'])
+        self.assertEqual(self.get_stats()['published_patches'], 1)
+
+    def test_stats_follow_users(self):
+        user = User.objects.create_user(username='user1', password='12345')
+        self.assertEqual(self.get_stats()['registered_users'], 2)
+
+        user.delete()
+        self.assertEqual(self.get_stats()['registered_users'], 1)
+
+    def test_stats_match_refresh(self):
+        patch = Patch.objects.create(title='Test Patch', user=self.author, state='published')
+        Patch.objects.create(title='Test Patch', user=self.author, state='hidden')
+        User.objects.create_user(username='user1', password='12345')
+        patch.upvote(self.author)
+
+        stats = self.get_stats()
+        self.assertEqual(refresh_stats(), stats)
+
+    def test_adjust_stat_is_constant(self):
+        Patch.objects.create(title='Test Patch', user=self.author, state='published')
+
+        # one UPDATE per stat, the patch table is not scanned
+        with CaptureQueriesContext(connection) as queries:
+            Patch.objects.create(title='Test Patch', user=self.author, state='published')
+
+        stat_queries = [query['sql'] for query in queries if 'patcher_landingpagestat' in query['sql']]
+        self.assertEqual(len(stat_queries), 2)
+        self.assertTrue(all(sql.startswith('UPDATE') for sql in stat_queries))
+
 class ProfileTestCase(TestCase):
     def test_create_profile_default(self):
         user = User.objects.create_user(username='profiletest_default', password='12345')
@@ -197,6 +402,28 @@ class ProfileTestCase(TestCase):
         self.assertEqual(profile.avatar, 'avatars/default.svg')
         self.assertEqual(Profile.objects.count(), 1)
     
+    def test_user_save_skips_unchanged_profile(self):
+        user = User.objects.create_user(username='profiletest_unchanged', password='12345')
+        user.profile
+
+        with CaptureQueriesContext(connection) as queries:
+            user.first_name = 'Test'
+            user.save()
+
+        self.assertEqual([query['sql'] for query in queries if 'patcher_profile' in query['sql']], [])
+
+    def test_user_save_writes_changed_profile(self):
+        user = User.objects.get(pk=User.objects.create_user(username='profiletest_changed', password='12345').pk)
+        user.profile.bio = 'This is a test bio'
+
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+
+        profile_queries = [query['sql'] for query in queries if 'patcher_profile' in query['sql']]
+        self.assertEqual(len(profile_queries), 1)
+        self.assertNotIn('avatar', profile_queries[0])
+        self.assertEqual(Profile.objects.get(user=user).bio, 'This is a test bio')
+
     def test_create_profile_no_user(self):
         with self.assertRaises(ValueError):
             profile = Profile.objects.create(
@@ -1,14 +1,45 @@
-from django.test import TestCase
-from rest_framework.test import APIClient
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
 
 from django.contrib.auth import models as auth_models
-from patcher.models import Patch, PatchContent
+from django.contrib.auth.models import update_last_login
+from patcher.models import Patch, PatchContent, LandingPageStat, Profile, UploadSession
 from patcher.serializers import PatchSerializer
+from patcher.views import PatchViewSet, UserPatchViewSet, PatchContentViewSet
+from patcher.async_views import AsyncViewMixin, AsyncPatchViewSet, AsyncPatchDetail, AsyncPatchContentViewSet, AsyncLandingPageStatViewSet
+from patcher.conditional import AsyncConditionalGetMixin
+from patcher.urls import read_view
+from patcher.stats import refresh_stats
+from patcher.votes import vote_buffer, add_upvotes_bulk
+from patcher.cache import get_or_compute, get_feed_version
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from patcher.authentication import purge_expired_tokens, get_blacklist_cache_key
+from patcher.uploads import UploadError, write_part, collect_upload_sessions
+from patcher.images import image_pipeline
+from patcher.content import diff_blocks
+from patcher.ranking import hot_score
+from django.utils import timezone
+from PIL import Image
 
 import os
+import io
+import shutil
+import tempfile
+import datetime
 import time
+import json
+from unittest import mock
+from asgiref.sync import async_to_sync
+import hashlib
+import uuid
 
 class TestPatchViewSet(TestCase):
     def setUp(self):
@@ -68,6 +99,438 @@ class TestPatchViewSet(TestCase):
         self.assertEqual(response.data["results"][0]["title"], 'Test Patch 2')
         self.assertEqual(response.data["results"][1]["title"], 'Test Patch 1')
 
+    def test_query_count(self):
+        voters = [auth_models.User.objects.create_user(username=f'voter{i}', password='12345') for i in range(3)]
+        for i in range(20):
+            patch = Patch.objects.create(title=f'Bulk Patch {i}', user=voters[i % 3], state='published')
+            patch.upvoted_by.add(*voters)
+
+        # count and page - independent of the page size
+        for page_size in [2, 10, 22]:
+            with self.assertNumQueries(2):
+                response = self.client.get(reverse('patch-list'), {'page_size': page_size})
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["results"]), page_size)
+            self.assertNotIn('upvoted_by', response.data["results"][0])
+
+        # upvoted_by is still available on request, with one prefetch
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('patch-list'), {'page_size': 22, 'fields': 'title,upvoted_by'})
+
+        self.assertEqual(len(response.data["results"][0]["upvoted_by"]), 3)
+
+    def test_viewer_has_upvoted(self):
+        self.client.force_authenticate(user=self.user)
+
+        # count and page with the EXISTS annotation
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('patch-list'), {'ordering': '-upvotes'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([patch['viewer_has_upvoted'] for patch in response.data['results']], [True, False])
+
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse('patch-list'), {'ordering': '-upvotes'})
+
+        self.assertEqual([patch['viewer_has_upvoted'] for patch in response.data['results']], [False, False])
+
+    def test_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('patch-list'), {'fields': 'uuid,title,thumbnail,upvotes,user.username'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), {'uuid', 'title', 'thumbnail', 'upvotes', 'user'})
+
+        # count and page, upvoted_by is not prefetched and unused columns are not loaded
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('"description"', queries[1]['sql'])
+        self.assertIn('"auth_user"."username"', queries[1]['sql'])
+
+    def test_omit_fields(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('patch-list'), {'omit': 'upvoted_by,description'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('upvoted_by', response.data['results'][0])
+        self.assertNotIn('description', response.data['results'][0])
+        self.assertIn('title', response.data['results'][0])
+
+    def test_sparse_fields_cursor_pagination(self):
+        # the ordering column is still loaded for the cursor of the last row
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('patch-list'), {'fields': 'title', 'pagination': 'cursor', 'page_size': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [{'title': 'Test Patch 2'}])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_cursor_pagination(self):
+        for i in range(10):
+            Patch.objects.create(title=f'Bulk Patch {i}', user=self.user, state='published')
+
+        expected = list(Patch.objects.filter(state='published').order_by('-upvotes', '-uuid').values_list('title', flat=True))
+
+        # walk forward
+        titles = []
+        pages = []
+        url = reverse('patch-list') + '?pagination=cursor&ordering=-upvotes&page_size=5'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            titles += [patch['title'] for patch in response.data['results']]
+            pages.append(response.data)
+            url = response.data['next']
+
+        self.assertEqual(titles, expected)
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]['previous'])
+
+        # walk back from the last page
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], pages[1]['results'])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(response.data['results'], pages[0]['results'])
+        self.assertIsNone(response.data['previous'])
+
+    def test_cursor_pagination_query_count(self):
+        # no COUNT query in cursor mode
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('patch-list'), {'pagination': 'cursor', 'ordering': 'created'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([patch['title'] for patch in response.data['results']], ['Test Patch 1', 'Test Patch 2'])
+        self.assertIsNone(response.data['next'])
+
+    def test_filters(self):
+        other = auth_models.User.objects.create_user(username='otheruser', password='12345')
+        Patch.objects.create(title='Other Patch', version='2.0.0', user=other, state='published')
+        Patch.objects.create(title='Thumbnail Patch', version='2.0.0', user=other, state='published', thumbnail='thumbnails/test.png')
+
+        def titles(params):
+            response = self.client.get(reverse('patch-list'), {'ordering': 'created', **params})
+            self.assertEqual(response.status_code, 200)
+            return [patch['title'] for patch in response.data['results']]
+
+        self.assertEqual(titles({'author': other.id}), ['Other Patch', 'Thumbnail Patch'])
+        self.assertEqual(titles({'version': '1.0.0'}), ['Test Patch 1', 'Test Patch 2'])
+        self.assertEqual(titles({'min_upvotes': 1}), ['Test Patch 2'])
+        self.assertEqual(titles({'has_thumbnail': 'true'}), ['Thumbnail Patch'])
+        self.assertEqual(titles({'has_thumbnail': 'false', 'author': other.id}), ['Other Patch'])
+        self.assertEqual(titles({'created_after': self.patch2.created.isoformat()}), ['Test Patch 2', 'Other Patch', 'Thumbnail Patch'])
+        self.assertEqual(titles({'created_before': self.patch2.created.isoformat()}), ['Test Patch 1'])
+
+        response = self.client.get(reverse('patch-list'), {'min_upvotes': 'many'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_filters_query_count(self):
+        # combined filters still run as the count and the page
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('patch-list'), {
+                'author': self.user.id,
+                'version': '1.0.0',
+                'min_upvotes': 1,
+                'created_after': '2000-01-01T00:00:00Z',
+                'has_thumbnail': 'false',
+            })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(len(queries), 2)
+        self.assertIn('"patcher_patch"."version" =', queries[1]['sql'])
+
+    def test_state_filter_for_owners(self):
+        response = self.client.get(reverse('user-patches'), {'user_id': self.user.id, 'state': 'draft'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('user-patches'), {'state': 'draft'})
+        self.assertEqual([patch['title'] for patch in response.data['results']], ['Test Patch 3'])
+
+        # the feed only ever lists published patches
+        response = self.client.get(reverse('patch-list'), {'state': 'draft'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_trending_ordering(self):
+        old = Patch.objects.create(title='Old Patch', user=self.user, state='published')
+        Patch.objects.filter(pk=old.pk).update(created=old.created - datetime.timedelta(days=7))
+        old.refresh_from_db()
+        old.upvoted_by.add(self.user)
+        old.upvotes = 50
+        old.save()
+
+        response = self.client.get(reverse('patch-list'), {'ordering': '-trending'})
+
+        self.assertEqual(response.status_code, 200)
+        # the old popular patch sinks below the new ones
+        self.assertEqual(response.data['results'][-1]['title'], 'Old Patch')
+        self.assertEqual(response.data['results'][0]['title'], 'Test Patch 2')
+
+        response = self.client.get(reverse('patch-list'), {'ordering': '-trending', 'pagination': 'cursor', 'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([patch['title'] for patch in response.data['results']], ['Old Patch'])
+
+    def test_cursor_pagination_invalid(self):
+        response = self.client.get(reverse('patch-list'), {'cursor': 'invalid-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(reverse('patch-list'), {'pagination': 'cursor', 'ordering': 'title'})
+        self.assertEqual(response.status_code, 404)
+
+        # cursors are bound to the ordering they were created for
+        response = self.client.get(reverse('patch-list'), {'pagination': 'cursor', 'ordering': 'created', 'page_size': 1})
+        response = self.client.get(reverse('patch-list'), {'cursor': response.data['next'].split('cursor=')[-1], 'ordering': 'upvotes'})
+        self.assertEqual(response.status_code, 404)
+
+class TestFeedCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
+
+        self.patch1 = Patch.objects.create(title='Test Patch 1', user=self.user, state='published')
+        self.patch2 = Patch.objects.create(title='Test Patch 2', user=self.user, state='published')
+
+    def test_anonymous_feed_is_cached(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('patch-list'), {'ordering': '-created'})
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse('patch-list'), {'ordering': '-created'})
+
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.data, response.data)
+
+        # another ordering is another page
+        with self.assertNumQueries(2):
+            self.client.get(reverse('patch-list'), {'ordering': '-upvotes'})
+
+    def test_authenticated_feed_is_not_cached(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse('patch-list'))
+
+        with self.assertNumQueries(2):
+            self.client.get(reverse('patch-list'))
+
+    def test_other_params_bypass_cache(self):
+        self.client.get(reverse('patch-list'), {'fields': 'title'})
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('patch-list'), {'fields': 'title'})
+
+        self.assertEqual(set(response.data['results'][0]), {'title'})
+
+    def test_patch_changes_invalidate_feed(self):
+        self.client.get(reverse('patch-list'))
+
+        Patch.objects.create(title='Test Patch 3', user=self.user, state='published')
+        response = self.client.get(reverse('patch-list'))
+        self.assertEqual(response.data['count'], 3)
+
+        self.patch1.delete()
+        response = self.client.get(reverse('patch-list'))
+        self.assertEqual(response.data['count'], 2)
+
+        self.patch2.upvote(self.user)
+        response = self.client.get(reverse('patch-list'), {'ordering': '-upvotes'})
+        self.assertEqual(response.data['results'][0]['upvotes'], 1)
+
+        version = get_feed_version()
+        self.patch2.upvoted_by.remove(self.user)
+        self.assertNotEqual(get_feed_version(), version)
+
+    def test_get_or_compute_serves_stale_value(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(get_or_compute('test:key', compute, timeout=30), 1)
+        self.assertEqual(get_or_compute('test:key', compute, timeout=30), 1)
+
+        # an expired entry is recomputed by the client holding the lock, others get the stale value
+        cache.set('test:key', (time.time() - 1, 1), 60)
+        cache.add('test:key:lock', True, 5)
+        self.assertEqual(get_or_compute('test:key', compute, timeout=30), 1)
+
+        cache.delete('test:key:lock')
+        self.assertEqual(get_or_compute('test:key', compute, timeout=30), 2)
+        self.assertEqual(len(calls), 2)
+
+class TestPatchSearch(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
+
+        self.title_match = Patch.objects.create(title='Balance changes', description='Weapons', user=self.user, state='published')
+        self.content_match = Patch.objects.create(title='Patch notes', description='Maps', user=self.user, state='published')
+        self.draft = Patch.objects.create(title='Balance draft', user=self.user, state='draft')
+
+        PatchContent.objects.create(post=self.content_match, text='Small balance fixes for snipers', order=1, type='textField')
+
+    def test_search(self):
+        response = self.client.get(reverse('patch-search'), {'q': 'balance'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        # title matches rank above content matches, drafts are not searchable
+        self.assertEqual([patch['title'] for patch in response.data['results']], ['Balance changes', 'Patch notes'])
+
+    def test_search_content(self):
+        response = self.client.get(reverse('patch-search'), {'q': 'sniper'})
+
+        self.assertEqual([patch['title'] for patch in response.data['results']], ['Patch notes'])
+        self.assertNotIn('search_vector', response.data['results'][0])
+
+    def test_search_follows_edits(self):
+        self.title_match.title = 'Weapon tuning'
+        self.title_match.save()
+
+        response = self.client.get(reverse('patch-search'), {'q': 'balance'})
+        self.assertEqual([patch['title'] for patch in response.data['results']], ['Patch notes'])
+
+    def test_search_uses_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('patch-search'), {'q': 'balance'})
+
+        self.assertIn('@@', queries[-1]['sql'])
+        self.assertNotIn('ILIKE', queries[-1]['sql'])
+
+    def test_search_without_query(self):
+        response = self.client.get(reverse('patch-search'))
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_cursor_pagination(self):
+        response = self.client.get(reverse('patch-search'), {'q': 'balance', 'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(reverse('patch-search'), {'q': 'balance', 'cursor': 'token'})
+        self.assertEqual(response.status_code, 400)
+
+class TestSuggestionView(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.user = auth_models.User.objects.create_user(username='balancer', password='12345')
+        auth_models.User.objects.create_user(username='sniper', password='12345')
+
+        Patch.objects.create(title='Balance changes', user=self.user, state='published')
+        Patch.objects.create(title='Map rotation', user=self.user, state='published')
+        Patch.objects.create(title='Balance draft', user=self.user, state='draft')
+
+    def test_suggest(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('suggest'), {'q': 'bala'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([patch['title'] for patch in response.data['patches']], ['Balance changes'])
+        self.assertEqual(response.data['users'], [{'id': self.user.id, 'username': 'balancer'}])
+
+    def test_suggest_typo(self):
+        response = self.client.get(reverse('suggest'), {'q': 'rotaton'})
+
+        self.assertEqual([patch['title'] for patch in response.data['patches']], ['Map rotation'])
+
+    def test_suggest_limit(self):
+        for i in range(5):
+            Patch.objects.create(title=f'Balance pass {i}', user=self.user, state='published')
+
+        response = self.client.get(reverse('suggest'), {'q': 'balance', 'limit': 3})
+        self.assertEqual(len(response.data['patches']), 3)
+
+        response = self.client.get(reverse('suggest'), {'q': 'balance', 'limit': 'many'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_suggest_short_query(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('suggest'), {'q': 'b'})
+
+        self.assertEqual(response.data, {'patches': [], 'users': []})
+
+class TestImagePipeline(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_PIPELINE_WORKERS=0, IMAGE_DERIVATIVE_WIDTHS=[320, 640, 1280])
+        self.settings_override.enable()
+
+        self.client = APIClient()
+        self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def make_image(self, name, width, height):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (width, height), (255, 0, 0, 128)).save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_thumbnail_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            patch = Patch.objects.create(title='Test Patch', user=self.user, state='published', thumbnail=self.make_image('thumb.png', 800, 400))
+
+        patch.refresh_from_db()
+        derivatives = patch.image_derivatives[patch.thumbnail.name]
+        # widths above the original are skipped
+        self.assertEqual(set(derivatives), {'webp', 'jpeg'})
+        self.assertEqual(set(derivatives['webp']), {'320', '640'})
+
+        with default_storage.open(derivatives['jpeg']['320']) as file:
+            self.assertEqual(Image.open(file).size, (320, 160))
+
+        response = self.client.get(reverse('patch-list'))
+        srcset = response.data['results'][0]['thumbnail_srcset']
+        self.assertTrue(srcset['webp']['640'].endswith('_640w.webp'))
+        self.assertNotIn('image_derivatives', response.data['results'][0])
+
+        # the map is loaded along with a sparse field
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('patch-list'), {'fields': 'title,thumbnail_srcset'})
+        self.assertEqual(response.data['results'][0]['thumbnail_srcset'], srcset)
+
+    def test_small_image_keeps_its_width(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            patch = Patch.objects.create(title='Test Patch', user=self.user, thumbnail=self.make_image('small.png', 100, 100))
+
+        patch.refresh_from_db()
+        self.assertEqual(set(patch.image_derivatives[patch.thumbnail.name]['webp']), {'100'})
+
+    def test_content_image_derivatives(self):
+        patch = Patch.objects.create(title='Test Patch', user=self.user, state='published')
+        name = default_storage.save('images/block.png', self.make_image('block.png', 700, 700))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PatchContent.objects.create(post=patch, images=[name], order=1, type='singleImage')
+
+        response = self.client.get(reverse('patch-content', kwargs={'uuid': patch.uuid}))
+        self.assertEqual(set(response.data[0]['images_srcset'][0]['jpeg']), {'320', '640'})
+
+    def test_unreadable_image(self):
+        name = default_storage.save('images/broken.png', SimpleUploadedFile('broken.png', b'not an image'))
+        patch = Patch.objects.create(title='Test Patch', user=self.user, state='published')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            block = PatchContent.objects.create(post=patch, images=[name], order=1, type='singleImage')
+
+        # recorded as processed, so it is not queued again
+        block.refresh_from_db()
+        self.assertEqual(block.image_derivatives, {name: {}})
+
+    def test_default_avatar_is_skipped(self):
+        response = self.client.get(reverse('user-profile', kwargs={'id': self.user.profile.id}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['avatar_srcset'])
+
 class TestUserPatchViewSet(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -128,6 +591,17 @@ class TestUserPatchViewSet(TestCase):
         self.assertEqual(response.data["results"][0]["title"], 'Test Patch 2')
         self.assertEqual(response.data["results"][1]["title"], 'Test Patch 1')
 
+    def test_query_count(self):
+        for i in range(20):
+            Patch.objects.create(title=f'Bulk Patch {i}', user=self.user, state='published').upvoted_by.add(self.user)
+
+        for page_size in [2, 10, 22]:
+            with self.assertNumQueries(2):
+                response = self.client.get(reverse('user-patches'), {'user_id': self.user.id, 'page_size': page_size})
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["results"]), page_size)
+
 class TestPatchCreate(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -196,6 +670,50 @@ class TestPatchCreate(TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertEqual(Patch.objects.count(), 1)
 
+    def create_patch(self, blocks):
+        return self.client.post(reverse('new-patch'), {
+            'title': 'Test Patch',
+            'version': '1.0.0',
+            'description': 'This is a test patch',
+            'state': 'published',
+            'content': json.dumps(blocks)
+        })
+
+    def test_create_patch_query_count(self):
+        self.client.force_authenticate(user=self.user)
+
+        query_counts = []
+        for count in [1, 40]:
+            blocks = [{'text': f'Block {i}', 'order': i + 1, 'type': 'textField'} for i in range(count)]
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.create_patch(blocks)
+
+            self.assertEqual(response.status_code, 201)
+            query_counts.append(len(queries))
+
+        # blocks are inserted with a single query
+        self.assertEqual(query_counts[0], query_counts[1])
+
+        patch = Patch.objects.get(uuid=response.data['uuid'])
+        self.assertEqual(list(patch.content.order_by('order').values_list('text', flat=True)), [f'Block {i}' for i in range(40)])
+
+    def test_create_patch_invalid_block(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.create_patch([
+            {'text': 'Valid block', 'order': 1, 'type': 'textField'},
+            {'text': 'Image block without images', 'order': 2, 'type': 'singleImage'},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('non_field_errors', response.data[1])
+
+        # nothing is left behind
+        self.assertEqual(Patch.objects.count(), 0)
+        self.assertEqual(PatchContent.objects.count(), 0)
+
     def test_create_patch_unauthenticated(self):
         response = self.client.post(reverse('new-patch'), {
             'title': 'Test Patch',
@@ -271,12 +789,178 @@ class TestPatchContentViewSet(TestCase):
 
         self.assertEqual(response.status_code, 404)
 
+    def test_list_patch_content_ordered(self):
+        for order in [3, 1, 2]:
+            PatchContent.objects.create(post=self.patch, text=f'Block {order}', order=order, type='textField')
+
+        # the validators of the patch and the blocks
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('patch-content', kwargs={'uuid': self.patch.uuid}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([block['text'] for block in response.data], ['Block 1', 'Block 2', 'Block 3'])
+
+    def test_list_patch_content_sparse_fields(self):
+        PatchContent.objects.create(post=self.patch, text='Block', order=1, type='textField')
+
+        response = self.client.get(reverse('patch-content', kwargs={'uuid': self.patch.uuid}), {'fields': 'text,order'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{'text': 'Block', 'order': 1}])
+
+    def test_list_patch_content_missing_patch(self):
+        response = self.client.get(reverse('patch-content', kwargs={'uuid': '00000000-0000-0000-0000-000000000000'}))
+
+        self.assertEqual(response.status_code, 404)
+
     def test_list_patch_content_unauthenticated(self):
         response = self.client.get(reverse('patch-content', kwargs={'uuid': self.patch.uuid}))
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data), 0)
 
+    def test_list_patch_content_not_modified(self):
+        PatchContent.objects.create(post=self.patch, text='Block', order=1, type='textField')
+
+        response = self.client.get(reverse('patch-content', kwargs={'uuid': self.patch.uuid}))
+        self.assertIn('ETag', response)
+        # derivatives do not touch updated, so the timestamp is not a validator
+        self.assertNotIn('Last-Modified', response)
+
+        # only the validators are queried
+        with self.assertNumQueries(1):
+            cached = self.client.get(reverse('patch-content', kwargs={'uuid': self.patch.uuid}), HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+
+        # a new block changes the ETag
+        PatchContent.objects.create(post=self.patch, text='Block', order=2, type='textField')
+        response = self.client.get(reverse('patch-content', kwargs={'uuid': self.patch.uuid}), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+
+class TestPatchDetail(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
+
+        self.patch = Patch.objects.create(
+            title='Test Patch',
+            version='1.0.0',
+            description='This is a test patch',
+            user=self.user,
+            state='published')
+
+        for order in [2, 1]:
+            PatchContent.objects.create(post=self.patch, text=f'Block {order}', order=order, type='textField')
+
+    def test_get_patch(self):
+        response = self.client.get(reverse('patch-detail', kwargs={'uuid': self.patch.uuid}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Test Patch')
+        self.assertNotIn('content', response.data)
+
+    def test_get_patch_expand_content(self):
+        # validators, patch with its author, upvoted_by and content
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('patch-detail', kwargs={'uuid': self.patch.uuid}), {'expand': 'content'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Test Patch')
+        self.assertEqual(response.data['user']['username'], 'testuser')
+        self.assertEqual([block['text'] for block in response.data['content']], ['Block 1', 'Block 2'])
+
+    def test_get_patch_viewer_has_upvoted(self):
+        self.patch.upvote(self.user)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('patch-detail', kwargs={'uuid': self.patch.uuid}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['viewer_has_upvoted'])
+        # the detail still lists the upvoters
+        self.assertEqual(response.data['upvoted_by'], [self.user.id])
+
+    def test_get_patch_sparse_fields(self):
+        response = self.client.get(reverse('patch-detail', kwargs={'uuid': self.patch.uuid}), {'expand': 'content', 'fields': 'title,content'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'title', 'content'})
+        # nested blocks are not narrowed
+        self.assertIn('type', response.data['content'][0])
+
+    def test_get_patch_not_found(self):
+        response = self.client.get(reverse('patch-detail', kwargs={'uuid': '00000000-0000-0000-0000-000000000000'}), {'expand': 'content'})
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_patch_not_modified(self):
+        url = reverse('patch-detail', kwargs={'uuid': self.patch.uuid})
+
+        response = self.client.get(url)
+        self.assertIn('ETag', response)
+        # upvotes do not touch updated, so the timestamp is not a validator
+        self.assertNotIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+        # other representations have their own ETag
+        response_expanded = self.client.get(url, {'expand': 'content'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response_expanded.status_code, 200)
+
+        # an upvote invalidates the ETag
+        self.patch.upvote(self.user)
+        response_upvoted = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response_upvoted.status_code, 200)
+        self.assertEqual(response_upvoted.data['upvotes'], 1)
+
+        # so does an edit
+        self.patch.title = 'Updated Patch'
+        self.patch.save()
+        response_updated = self.client.get(url, HTTP_IF_NONE_MATCH=response_upvoted['ETag'])
+        self.assertEqual(response_updated.status_code, 200)
+        self.assertEqual(response_updated.data['title'], 'Updated Patch')
+
+    def test_get_patch_expand_content_not_modified(self):
+        url = reverse('patch-detail', kwargs={'uuid': self.patch.uuid})
+
+        response = self.client.get(url, {'expand': 'content'})
+        cached = self.client.get(url, {'expand': 'content'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        # derivatives are written to the blocks without saving the patch
+        PatchContent.objects.filter(post=self.patch).update(image_derivatives={'block.png': {}})
+        response = self.client.get(url, {'expand': 'content'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_patch_not_modified_same_counts(self):
+        url = reverse('patch-detail', kwargs={'uuid': self.patch.uuid})
+        other_user = auth_models.User.objects.create_user(username='otheruser', password='12345')
+        self.patch.upvote(self.user)
+
+        response = self.client.get(url)
+
+        # another voter, the count is unchanged but upvoted_by is not
+        self.patch.remove_upvote(self.user)
+        self.patch.upvote(other_user)
+        response_swapped = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response_swapped.status_code, 200)
+        self.assertEqual(response_swapped.data['upvoted_by'], [other_user.id])
+
+        # renaming the author does not save the patch
+        self.user.username = 'renameduser'
+        self.user.save()
+        response_renamed = self.client.get(url, HTTP_IF_NONE_MATCH=response_swapped['ETag'])
+        self.assertEqual(response_renamed.status_code, 200)
+        self.assertEqual(response_renamed.data['user']['username'], 'renameduser')
+
 class TestUserViewSet(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -368,6 +1052,38 @@ class TestUserViewSet(TestCase):
         self.assertEqual(response.status_code, 201)
         self.assertEqual(auth_models.User.objects.count(), 1)
 
+    def test_create_user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('user-create'), {
+                'username': 'testuser',
+                'email': 'testuser@testmail.com',
+                'password': '12345',
+            })
+
+        self.assertEqual(response.status_code, 201)
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        # username check, user, profile and the user count
+        self.assertEqual(len(statements), 4)
+        self.assertEqual([sql for sql in statements if 'patcher_profile' in sql and not sql.startswith('INSERT')], [])
+
+        profile = auth_models.User.objects.get(username='testuser').profile
+        self.assertEqual(profile.bio, profile.get_default_bio())
+
+    def test_login_queries(self):
+        user = auth_models.User.objects.create_user(username='testuser', password='12345')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('token-obtain-pair'), {'username': 'testuser', 'password': '12345'})
+
+        self.assertEqual(response.status_code, 200)
+        # the user lookup and the outstanding refresh token
+        self.assertEqual(len(queries), 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            update_last_login(None, user)
+
+        self.assertEqual(len(queries), 1)
+
     def test_get_user_anon(self):
         user = auth_models.User.objects.create_user(username='testuser', password='12345')
 
@@ -434,29 +1150,164 @@ class TestProfileDetail(TestCase):
         self.assertEqual(response.data['username'], 'testuser')
         self.assertEqual(response.data['bio'], 'This is a test bio')
 
-class TestUpvotePost(TestCase):
-    def setUp(self):
-        self.client = APIClient()
+    def test_get_profile_not_modified(self):
+        user = auth_models.User.objects.create_user(username='testuser', password='12345')
+        url = reverse('user-profile', kwargs={'id': user.profile.id})
 
-        self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
 
-        self.patch = Patch.objects.create(
-            title='Test Patch',
-            version='1.0.0',
-            description='This is a test patch',   
-            user=self.user,
-            state='published')
+        self.assertNotIn('Last-Modified', response)
 
-    def test_upvote_patch(self):
-        self.client.force_authenticate(user=self.user)
-        response = self.client.post(reverse('upvote-patch', kwargs={'uuid': self.patch.uuid}))
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
 
-        self.patch.refresh_from_db()
+        profile = user.profile
+        profile.bio = 'This is a new bio'
+        profile.save()
 
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(self.patch.upvoted_by.count(), 1)
+        self.assertEqual(response.data['bio'], 'This is a new bio')
+
+        # a rename leaves the profile untouched
+        user.username = 'renameduser'
+        user.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'renameduser')
+
+    def test_get_current_profile_not_modified(self):
+        user = auth_models.User.objects.create_user(username='testuser', password='12345')
+        self.client.force_authenticate(user=user)
+
+        response = self.client.get(reverse('current-profile'))
+        cached = self.client.get(reverse('current-profile'), HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(cached.status_code, 304)
+
+        user.username = 'renameduser'
+        user.save()
+
+        response = self.client.get(reverse('current-profile'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'renameduser')
+
+class TestUserBatchView(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.users = [auth_models.User.objects.create_user(username=f'testuser{i}', password='12345') for i in range(3)]
+
+    def test_batch(self):
+        ids = [self.users[2].id, self.users[0].id, self.users[1].id]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('user-batch'), {'ids': ','.join(map(str, ids))})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        # the requested order is kept
+        self.assertEqual([user['id'] for user in response.data['results']], ids)
+        self.assertEqual(response.data['results'][0]['username'], 'testuser2')
+        self.assertEqual(response.data['results'][0]['profile']['id'], self.users[2].profile.id)
+        self.assertEqual(response.data['results'][0]['profile']['username'], 'testuser2')
+        self.assertEqual(response.data['missing'], [])
+
+    def test_batch_missing(self):
+        missing = max(user.id for user in self.users) + 1
+
+        response = self.client.get(reverse('user-batch'), {'ids': f'{missing},{self.users[0].id},{self.users[0].id}'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user['id'] for user in response.data['results']], [self.users[0].id])
+        self.assertEqual(response.data['missing'], [missing])
+
+    def test_batch_invalid(self):
+        self.assertEqual(self.client.get(reverse('user-batch')).status_code, 400)
+        self.assertEqual(self.client.get(reverse('user-batch'), {'ids': '1,abc'}).status_code, 400)
+
+    def test_batch_too_many(self):
+        response = self.client.get(reverse('user-batch'), {'ids': ','.join(str(i) for i in range(1, 102))})
+        self.assertEqual(response.status_code, 400)
+
+class TestLandingPageStatViewSet(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        LandingPageStat.objects.create(value=10, description='Patches')
+
+    def test_list_stats_cached(self):
+        response = self.client.get(reverse('landing-page-stat'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['value'], 10)
+
+        # served from the cache until it expires
+        LandingPageStat.objects.filter(description='Patches').update(value=20)
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse('landing-page-stat'))
+        self.assertEqual(cached.data, response.data)
+
+        cache.clear()
+        response = self.client.get(reverse('landing-page-stat'))
+        self.assertEqual(response.data['results'][0]['value'], 20)
+
+    def test_list_stats_not_modified(self):
+        response = self.client.get(reverse('landing-page-stat'))
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse('landing-page-stat'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        LandingPageStat.objects.filter(description='Patches').delete()
+        cache.clear()
+        response = self.client.get(reverse('landing-page-stat'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+class TestUpvotePost(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
+
+        self.patch = Patch.objects.create(
+            title='Test Patch',
+            version='1.0.0',
+            description='This is a test patch',   
+            user=self.user,
+            state='published')
+
+    def test_upvote_patch(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse('upvote-patch', kwargs={'uuid': self.patch.uuid}))
+
+        self.patch.refresh_from_db()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['upvotes'], 1)
+        self.assertEqual(self.patch.upvoted_by.count(), 1)
         self.assertEqual(self.patch.upvotes, 1)
 
+    def test_remove_upvote(self):
+        self.client.force_authenticate(user=self.user)
+        self.patch.upvote(self.user)
+
+        response = self.client.delete(reverse('upvote-patch', kwargs={'uuid': self.patch.uuid}))
+
+        self.patch.refresh_from_db()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['upvotes'], 0)
+        self.assertEqual(self.patch.upvoted_by.count(), 0)
+        self.assertEqual(self.patch.upvotes, 0)
+
+        response = self.client.delete(reverse('upvote-patch', kwargs={'uuid': self.patch.uuid}))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['upvotes'], 0)
+
     def test_upvote_patch_unauthenticated(self):
         response = self.client.post(reverse('upvote-patch', kwargs={'uuid': self.patch.uuid}))
 
@@ -482,6 +1333,140 @@ class TestUpvotePost(TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertEqual(self.patch.upvotes, 0)
 
+        response = self.client.post(reverse('upvote-patch', kwargs={'uuid': '00000000-0000-0000-0000-000000000000'}))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.patch.upvoted_by.count(), 0)
+
+@override_settings(VOTE_BUFFER_ENABLED=True, VOTE_BUFFER_FLUSH_INTERVAL=0)
+class TestBufferedUpvote(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
+        self.other_user = auth_models.User.objects.create_user(username='otheruser', password='12345')
+
+        self.patch = Patch.objects.create(
+            title='Test Patch',
+            version='1.0.0',
+            description='This is a test patch',
+            user=self.user,
+            state='published')
+
+    def tearDown(self):
+        vote_buffer.pending.clear()
+
+    def upvote(self, user, method='post'):
+        self.client.force_authenticate(user=user)
+        return getattr(self.client, method)(reverse('upvote-patch', kwargs={'uuid': self.patch.uuid}))
+
+    def test_upvote_is_buffered(self):
+        self.assertEqual(self.upvote(self.user).data['upvotes'], 1)
+        self.assertEqual(self.upvote(self.other_user).data['upvotes'], 2)
+
+        response = self.upvote(self.user)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['upvotes'], 2)
+
+        # nothing was written yet, but reads include the pending votes
+        self.patch.refresh_from_db()
+        self.assertEqual(self.patch.upvotes, 0)
+        self.assertEqual(self.patch.upvoted_by.count(), 0)
+
+        response = self.client.get(reverse('patch-list'))
+        self.assertEqual(response.data['results'][0]['upvotes'], 2)
+
+        self.assertEqual(vote_buffer.flush(), 2)
+
+        self.patch.refresh_from_db()
+        self.assertEqual(self.patch.upvotes, 2)
+        self.assertEqual(self.patch.upvoted_by.count(), 2)
+
+        response = self.client.get(reverse('patch-list'))
+        self.assertEqual(response.data['results'][0]['upvotes'], 2)
+
+    def test_upvote_already_stored(self):
+        self.patch.upvote(self.user)
+
+        response = self.upvote(self.user)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['upvotes'], 1)
+        self.assertEqual(vote_buffer.pending_count(self.patch.uuid), 0)
+
+    def test_remove_upvote(self):
+        self.patch.upvote(self.other_user)
+        self.upvote(self.user)
+
+        # pending vote is dropped from the buffer
+        response = self.upvote(self.user, 'delete')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['upvotes'], 1)
+
+        # stored vote is removed from the database
+        response = self.upvote(self.other_user, 'delete')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['upvotes'], 0)
+
+        vote_buffer.flush()
+        self.patch.refresh_from_db()
+        self.assertEqual(self.patch.upvotes, 0)
+        self.assertEqual(self.patch.upvoted_by.count(), 0)
+
+    def test_remove_upvote_taken_by_flush(self):
+        vote_buffer.add(self.patch.uuid, self.user.id)
+        vote_buffer.add(self.patch.uuid, self.other_user.id)
+        withdrawn = []
+
+        def write_batch(batch):
+            # the other vote is taken by the flush but its batch has not started
+            if not withdrawn:
+                (_, written_user), = batch
+                user = self.other_user if written_user == self.user.id else self.user
+                withdrawn.append((user.id, vote_buffer.remove(self.patch.uuid, user.id)))
+            add_upvotes_bulk(batch)
+
+        with self.settings(VOTE_BUFFER_BATCH_SIZE=1), mock.patch('patcher.votes.add_upvotes_bulk', write_batch):
+            self.assertEqual(vote_buffer.flush(), 1)
+
+        user_id, result = withdrawn[0]
+        self.assertEqual(result, (True, 1))
+
+        self.patch.refresh_from_db()
+        self.assertEqual(self.patch.upvotes, 1)
+        self.assertNotIn(user_id, self.patch.upvoted_by.values_list('id', flat=True))
+
+    def test_count_after_flush(self):
+        vote_buffer.add(self.patch.uuid, self.user.id)
+        vote_buffer.flush()
+
+        # the flushed vote is counted once, from the database
+        self.assertEqual(vote_buffer.add(self.patch.uuid, self.other_user.id), (True, 2))
+
+    def test_flush_in_batches(self):
+        users = [auth_models.User.objects.create_user(username=f'voter{i}', password='12345') for i in range(5)]
+        other_patch = Patch.objects.create(title='Other Patch', user=self.user, state='published')
+
+        for user in users:
+            vote_buffer.add(self.patch.uuid, user.id)
+            vote_buffer.add(other_patch.uuid, user.id)
+
+        with self.settings(VOTE_BUFFER_BATCH_SIZE=3):
+            with self.assertNumQueries(4):
+                self.assertEqual(vote_buffer.flush(), 10)
+
+        self.patch.refresh_from_db()
+        other_patch.refresh_from_db()
+        self.assertEqual(self.patch.upvotes, 5)
+        self.assertEqual(other_patch.upvotes, 5)
+        self.assertEqual(other_patch.upvoted_by.count(), 5)
+
+    def test_upvote_not_found(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse('upvote-patch', kwargs={'uuid': '00000000-0000-0000-0000-000000000000'}))
+
+        self.assertEqual(response.status_code, 404)
+
 class TestPatchUpdate(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -523,10 +1508,11 @@ class TestPatchUpdate(TestCase):
 
         self.patch.refresh_from_db()
 
-        self.assertEqual(self.patch.title, 'Updated Patch')
-        self.assertEqual(self.patch.version, '1.0.1')
-        self.assertEqual(self.patch.description, 'This is an updated test patch')
-        self.assertEqual(self.patch.state, 'draft')
+        # the content is validated before anything is written, the header was not saved
+        self.assertEqual(self.patch.title, 'Test Patch')
+        self.assertEqual(self.patch.version, '1.0.0')
+        self.assertEqual(self.patch.description, 'This is a test patch')
+        self.assertEqual(self.patch.state, 'published')
     
     def test_update_patch_unauthenticated(self):
         response = self.client.patch(reverse('update-patch', kwargs={'uuid': self.patch.uuid}), {
@@ -580,13 +1566,37 @@ class TestPatchUpdate(TestCase):
         self.advanced_patch.refresh_from_db()
         self.patch_content1.refresh_from_db()
 
-        self.assertEqual(self.advanced_patch.title, 'Updated Patch')
-        self.assertEqual(self.advanced_patch.version, '1.0.1')
-        self.assertEqual(self.advanced_patch.description, 'This is an updated test patch')
-        self.assertEqual(self.advanced_patch.state, 'draft')
+        # the content is validated before anything is written, the header was not saved
+        self.assertEqual(self.advanced_patch.title, 'Advanced Patch')
+        self.assertEqual(self.advanced_patch.version, '1.0.0')
+        self.assertEqual(self.advanced_patch.description, 'This is an advanced test patch')
+        self.assertEqual(self.advanced_patch.state, 'published')
 
         self.assertEqual(self.patch_content1.text, 'Updated content')
     
+    def test_update_patch_keeps_concurrent_votes(self):
+        self.client.force_authenticate(user=self.user)
+        voter = auth_models.User.objects.create_user(username='voter', password='12345')
+
+        def vote_then_diff(patch, content_data):
+            # a vote committed after the view loaded the patch
+            Patch.objects.get(pk=patch.pk).upvote(voter)
+            return diff_blocks(patch, content_data)
+
+        with mock.patch('patcher.serializers.diff_blocks', vote_then_diff):
+            response = self.client.patch(reverse('update-patch', kwargs={'uuid': self.advanced_patch.uuid}), {
+                'title': 'Updated Patch',
+                'content': json.dumps([{'id': self.patch_content1.id}]),
+            })
+
+        self.assertEqual(response.status_code, 200)
+
+        self.advanced_patch.refresh_from_db()
+        self.assertEqual(self.advanced_patch.title, 'Updated Patch')
+        self.assertEqual(self.advanced_patch.upvotes, 1)
+        self.assertEqual(self.advanced_patch.upvoted_by.count(), 1)
+        self.assertAlmostEqual(self.advanced_patch.trending, hot_score(1, self.advanced_patch.created), places=6)
+
     def test_update_patch_content_invalid(self):
         self.client.force_authenticate(user=self.user)
 
@@ -603,10 +1613,11 @@ class TestPatchUpdate(TestCase):
         self.advanced_patch.refresh_from_db()
         self.patch_content1.refresh_from_db()
 
-        self.assertEqual(self.advanced_patch.title, 'Updated Patch')
-        self.assertEqual(self.advanced_patch.version, '1.0.1')
-        self.assertEqual(self.advanced_patch.description, 'This is an updated test patch')
-        self.assertEqual(self.advanced_patch.state, 'draft')
+        # the content is validated before anything is written, the header was not saved
+        self.assertEqual(self.advanced_patch.title, 'Advanced Patch')
+        self.assertEqual(self.advanced_patch.version, '1.0.0')
+        self.assertEqual(self.advanced_patch.description, 'This is an advanced test patch')
+        self.assertEqual(self.advanced_patch.state, 'published')
     
     def test_update_patch_content_invalid_id(self):
         self.client.force_authenticate(user=self.user)
@@ -624,12 +1635,22 @@ class TestPatchUpdate(TestCase):
 
         self.patch.refresh_from_db()
 
-        self.assertEqual(self.patch.title, 'Updated Patch')
-        self.assertEqual(self.patch.version, '1.0.1')
-        self.assertEqual(self.patch.description, 'This is an updated test patch')
-        self.assertEqual(self.patch.state, 'draft')
+        # the content is validated before anything is written, the header was not saved
+        self.assertEqual(self.patch.title, 'Test Patch')
+        self.assertEqual(self.patch.version, '1.0.0')
+        self.assertEqual(self.patch.description, 'This is a test patch')
+        self.assertEqual(self.patch.state, 'published')
 
-        # no id provided
+        # block of another patch
+        response = self.client.patch(reverse('update-patch', kwargs={'uuid': self.patch.uuid}), {
+            'content': '[{"id": ' + str(self.patch_content1.id) + ', "text": "Updated content", "order": 0, "type": "textField"}]'
+        })
+
+        self.assertEqual(response.status_code, 400)
+        self.patch_content1.refresh_from_db()
+        self.assertEqual(self.patch_content1.text, 'This is a test content')
+
+        # no id provided - a new block
         response = self.client.patch(reverse('update-patch', kwargs={'uuid': self.patch.uuid}), {
             'title': 'Updated Patch',
             'version': '1.0.1',
@@ -638,8 +1659,58 @@ class TestPatchUpdate(TestCase):
             'content': '[{"text": "Updated content", "order": 0, "type": "textField"}]'
         })
 
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.patch.content.values_list('text', flat=True)), ['Updated content'])
+
+    def test_update_patch_content_diff(self):
+        self.client.force_authenticate(user=self.user)
+
+        blocks = [
+            PatchContent.objects.create(post=self.advanced_patch, text=f'Block {i}', order=i + 1, type='textField')
+            for i in range(3)
+        ]
+        content = [
+            # reordered and edited
+            {'id': blocks[2].id, 'text': 'Edited block 2'},
+            # untouched, moved down
+            {'id': blocks[0].id},
+            {'text': 'New block', 'type': 'textField'},
+        ]
+
+        # one query each to load, delete, update and insert blocks
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(reverse('update-patch', kwargs={'uuid': self.advanced_patch.uuid}), {
+                'content': json.dumps(content)
+            })
+
+        self.assertEqual(response.status_code, 200)
+        # the search vector refresh reads the blocks too, it is not a block query
+        content_queries = [query['sql'] for query in queries if 'patcher_patchcontent' in query['sql'] and 'search_vector' not in query['sql']]
+        self.assertEqual(len(content_queries), 4)
+
+        # patch_content1 and blocks[1] were left out and removed
+        stored = list(self.advanced_patch.content.order_by('order').values_list('text', 'order'))
+        self.assertEqual(stored, [('Edited block 2', 1), ('Block 0', 2), ('New block', 3)])
+
+    def test_update_patch_content_invalid_block(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.patch(reverse('update-patch', kwargs={'uuid': self.advanced_patch.uuid}), {
+            'title': 'Updated Patch',
+            'content': json.dumps([
+                {'id': self.patch_content1.id, 'text': 'Updated content'},
+                {'text': 'Image block without images', 'type': 'singleImage'},
+            ])
+        })
+
         self.assertEqual(response.status_code, 400)
-        self.patch.refresh_from_db()
+
+        # nothing was applied, the header included
+        self.advanced_patch.refresh_from_db()
+        self.assertEqual(self.advanced_patch.title, 'Advanced Patch')
+        self.patch_content1.refresh_from_db()
+        self.assertEqual(self.patch_content1.text, 'This is a test content')
+        self.assertEqual(self.advanced_patch.content.count(), 1)
 
 class TestUploadView(TestCase):
     def setUp(self):
@@ -648,10 +1719,17 @@ class TestUploadView(TestCase):
         self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
         self.image_path = os.path.join(os.path.dirname(__file__), 'test_image.png')
 
+        # uploads are stored under a throwaway MEDIA_ROOT
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
         with open(self.image_path, 'wb') as img:
             img.write(b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x10\x00\x00\x00\x10\x08\x06\x00\x00\x00\x1f\xf3\xff\xa0\x00\x00\x00\nIDAT\x08\xd7c\xf8\x0f\x00\x01\x05\x01\x01\x00\x00\x00\x00IEND\xaeB`\x82')
 
     def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
 
         # ensure the file is closed before trying to delete it
         time.sleep(1)
@@ -692,4 +1770,489 @@ class TestUploadView(TestCase):
         response = self.client.post(reverse('upload'), {'file': 'invalid file'}, format='multipart')
 
         # Assert the upload was successful
-        self.assertEqual(response.status_code, 400)
\ No newline at end of file
+        self.assertEqual(response.status_code, 400)
+
+    def test_upload_deduplicated(self):
+        self.client.force_authenticate(user=self.user)
+
+        with open(self.image_path, 'rb') as img:
+            content = img.read()
+
+        first = self.client.post(reverse('upload'), {'file': SimpleUploadedFile('first.png', content, content_type='image/png')}, format='multipart')
+        second = self.client.post(reverse('upload'), {'file': SimpleUploadedFile('second.PNG', content, content_type='image/png')}, format='multipart')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        # same content, same stored object under its SHA-256
+        self.assertEqual(first.data['url'], second.data['url'])
+        self.assertIn(first.data['sha256'], first.data['url'])
+        self.assertEqual(first.data['size'], len(content))
+        self.assertTrue(second.data['deduplicated'])
+
+        stored = os.path.join(self.media_root, 'files', first.data['sha256'][:2], first.data['sha256'] + '.png')
+        self.assertTrue(os.path.exists(stored))
+
+    @override_settings(UPLOAD_MAX_SIZE=1024)
+    def test_upload_too_large(self):
+        self.client.force_authenticate(user=self.user)
+
+        uploaded_file = SimpleUploadedFile('large.png', b'x' * 4096, content_type='image/png')
+        response = self.client.post(reverse('upload'), {'file': uploaded_file}, format='multipart')
+
+        self.assertEqual(response.status_code, 413)
+
+class InterruptedStream:
+    """Request body dropping the connection after a number of bytes"""
+
+    def __init__(self, content, dropped_after):
+        self.stream = io.BytesIO(content[:dropped_after])
+
+    def read(self, size):
+        return self.stream.read(size)
+
+class TestResumableUpload(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
+        self.client.force_authenticate(user=self.user)
+
+        self.media_root = tempfile.mkdtemp()
+        self.session_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root, UPLOAD_SESSION_ROOT=self.session_root)
+        self.settings.enable()
+
+        self.content = os.urandom(3000)
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        shutil.rmtree(self.session_root, ignore_errors=True)
+
+    def start(self, size=None):
+        response = self.client.post(reverse('upload-session-create'), {'filename': 'gallery.png', 'size': size or len(self.content)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def put_part(self, session_id, number, content):
+        return self.client.put(reverse('upload-part', args=[session_id, number]), data=content, content_type='application/octet-stream')
+
+    def test_resume_after_interruption(self):
+        session_id = self.start()
+        first, second = self.content[:2000], self.content[2000:]
+
+        self.assertEqual(self.put_part(session_id, 1, first).status_code, 200)
+
+        # the connection drops halfway through the second part
+        session = UploadSession.objects.get(id=session_id)
+        with self.assertRaises(UploadError):
+            write_part(session, 2, InterruptedStream(second, 500), len(second))
+
+        # only the complete part is kept, nothing is left of the interrupted one
+        response = self.client.get(reverse('upload-session', args=[session_id]))
+        self.assertEqual(response.data['parts'], [{'number': 1, 'size': 2000}])
+        self.assertEqual(os.listdir(os.path.join(self.session_root, str(session_id))), ['00001.part'])
+
+        # the client resumes with the missing part and completes the upload
+        self.assertEqual(self.put_part(session_id, 2, second).status_code, 200)
+        response = self.client.post(reverse('upload-session-complete', args=[session_id]))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['sha256'], hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(response.data['size'], len(self.content))
+        self.assertTrue(response.data['url'].endswith('.png'))
+
+        stored = os.path.join(self.media_root, 'files', response.data['sha256'][:2], response.data['sha256'] + '.png')
+        with open(stored, 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+
+        # the session and its parts are gone
+        self.assertFalse(UploadSession.objects.filter(id=session_id).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.session_root, str(session_id))))
+
+    def test_part_retried(self):
+        session_id = self.start()
+
+        self.put_part(session_id, 1, b'x' * 1000)
+        self.put_part(session_id, 1, self.content)
+        response = self.client.post(reverse('upload-session-complete', args=[session_id]))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['sha256'], hashlib.sha256(self.content).hexdigest())
+
+    def test_complete_missing_part(self):
+        session_id = self.start()
+
+        self.put_part(session_id, 2, self.content[2000:])
+        response = self.client.post(reverse('upload-session-complete', args=[session_id]))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(UploadSession.objects.filter(id=session_id).exists())
+
+    def test_parts_larger_than_size(self):
+        session_id = self.start(size=100)
+
+        response = self.put_part(session_id, 1, self.content)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('upload-session', args=[session_id])).data['parts'], [])
+
+    @override_settings(UPLOAD_SESSION_MAX_SIZE=1024)
+    def test_session_too_large(self):
+        response = self.client.post(reverse('upload-session-create'), {'filename': 'gallery.png', 'size': 4096}, format='json')
+        self.assertEqual(response.status_code, 413)
+
+    def test_session_of_other_user(self):
+        session_id = self.start()
+        other = auth_models.User.objects.create_user(username='otheruser', password='12345')
+        self.client.force_authenticate(user=other)
+
+        self.assertEqual(self.put_part(session_id, 1, self.content).status_code, 404)
+        self.assertEqual(self.client.post(reverse('upload-session-complete', args=[session_id])).status_code, 404)
+
+    def test_abort(self):
+        session_id = self.start()
+        self.put_part(session_id, 1, self.content[:2000])
+
+        response = self.client.delete(reverse('upload-session', args=[session_id]))
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(os.path.exists(os.path.join(self.session_root, str(session_id))))
+
+    def test_collect_abandoned(self):
+        abandoned = self.start()
+        active = self.start()
+        self.put_part(abandoned, 1, self.content[:2000])
+        self.put_part(active, 1, self.content[:2000])
+        UploadSession.objects.filter(id=abandoned).update(expires=timezone.now() - datetime.timedelta(seconds=1))
+
+        # parts left behind by a session deleted without its directory
+        os.makedirs(os.path.join(self.session_root, str(uuid.uuid4())))
+
+        self.assertEqual(collect_upload_sessions(), 2)
+        self.assertFalse(UploadSession.objects.filter(id=abandoned).exists())
+        self.assertEqual(os.listdir(self.session_root), [str(active)])
+
+        # an expired session cannot be resumed
+        self.assertEqual(self.client.get(reverse('upload-session', args=[abandoned])).status_code, 404)
+
+class TestCachedAuthentication(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
+
+        # users are only cached when every worker sees the invalidations
+        shared = mock.patch('patcher.authentication.is_cache_shared', return_value=True)
+        shared.start()
+        self.addCleanup(shared.stop)
+
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def user_queries(self, queries):
+        return [query['sql'] for query in queries if 'auth_user' in query['sql'] or 'patcher_profile' in query['sql']]
+
+    def test_user_cached(self):
+        self.client.get(reverse('user-detail'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('user-detail'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'testuser')
+        self.assertEqual(len(queries), 0)
+
+    def test_profile_cached(self):
+        self.client.get(reverse('current-profile'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('current-profile'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'testuser')
+        # only the conditional GET validators are read
+        self.assertEqual(len(queries), 1)
+
+    def test_profile_save_invalidates(self):
+        self.client.get(reverse('current-profile'))
+
+        response = self.client.patch(reverse('current-profile'), {'bio': 'Updated bio'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(reverse('current-profile'))
+        self.assertEqual(response.data['bio'], 'Updated bio')
+
+    def test_profile_derivatives_invalidate(self):
+        Profile.objects.filter(user=self.user).update(avatar='avatars/me.png')
+        response = self.client.get(reverse('current-profile'))
+        self.assertIsNone(response.data['avatar_srcset'])
+
+        # the pipeline writes the derivatives with update(), which skips the signals
+        with mock.patch('patcher.images.generate_derivatives', return_value={'jpeg': {'320': 'avatars/me_320.jpg'}}):
+            image_pipeline.process(Profile, self.user.profile.pk, 'avatar')
+
+        response = self.client.get(reverse('current-profile'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('jpeg', response.data['avatar_srcset'])
+
+    def test_user_save_invalidates(self):
+        self.client.get(reverse('user-detail'))
+
+        self.user.username = 'renameduser'
+        self.user.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('user-detail'))
+
+        self.assertEqual(response.data['username'], 'renameduser')
+        self.assertTrue(self.user_queries(queries))
+
+    def test_deactivated_user_rejected(self):
+        self.client.get(reverse('user-detail'))
+
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(reverse('user-detail'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_not_cached_per_process(self):
+        self.client.get(reverse('user-detail'))
+
+        # another worker's save would not reach this cache, the user is read every time
+        with mock.patch('patcher.authentication.is_cache_shared', return_value=False):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('user-detail'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.user_queries(queries))
+
+    def test_cached_per_token(self):
+        self.client.get(reverse('user-detail'))
+
+        # a new token resolves the user again
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('user-detail'))
+
+        self.assertTrue(self.user_queries(queries))
+
+class TestTokenBlacklist(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
+        self.refresh = RefreshToken.for_user(self.user)
+
+    def blacklist_queries(self, queries):
+        return [query['sql'] for query in queries if 'token_blacklist_blacklistedtoken' in query['sql']]
+
+    @mock.patch('patcher.authentication.is_cache_shared', return_value=True)
+    def test_refresh_checks_blacklist_once(self, _):
+        response = self.client.post(reverse('token-refresh'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('token-refresh'), {'refresh': str(self.refresh)}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.blacklist_queries(queries), [])
+
+    def test_refresh_checks_blacklist_per_process_cache(self):
+        # a stale "not blacklisted" entry, the logout was handled by a worker with its own cache
+        cache.set(get_blacklist_cache_key(self.refresh['jti']), False)
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=self.refresh['jti']))
+
+        response = self.client.post(reverse('token-refresh'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_after_logout(self):
+        # the token was checked and cached as valid before the logout
+        self.client.post(reverse('token-refresh'), {'refresh': str(self.refresh)}, format='json')
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse('auth-logout'), {'refresh_token': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 205)
+
+        response = self.client.post(reverse('token-refresh'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_blacklisted_before_cached(self):
+        self.refresh.blacklist()
+        cache.clear()
+
+        response = self.client.post(reverse('token-refresh'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_purge_expired_tokens(self):
+        self.refresh.blacklist()
+        expired = OutstandingToken.objects.create(user=self.user, jti='expired', token='', expires_at=timezone.now() - datetime.timedelta(days=1))
+        BlacklistedToken.objects.create(token=expired)
+        OutstandingToken.objects.create(user=self.user, jti='expired-too', token='', expires_at=timezone.now() - datetime.timedelta(hours=1))
+
+        self.assertEqual(list(purge_expired_tokens(batch_size=1)), [1, 1])
+
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [self.refresh['jti']])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+class TestAsyncReadViews(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
+        self.patches = [
+            Patch.objects.create(title=f'Test Patch {i}', version='1.0.0', description='This is a test patch', user=self.user, state='published')
+            for i in range(3)
+        ]
+        Patch.objects.create(title='Draft Patch', user=self.user, state='draft')
+        self.patches[1].upvote(self.user)
+
+        self.patch = self.patches[0]
+        for order in [2, 1]:
+            PatchContent.objects.create(post=self.patch, text=f'Block {order}', order=order, type='textField')
+
+        refresh_stats()
+
+    def get_both(self, name, kwargs=None, params=None):
+        """Request an endpoint from its sync view and from its async view"""
+
+        sync = self.client.get(reverse(name, kwargs=kwargs), params)
+        # both views share the feed and stats cache entries
+        cache.clear()
+        async_ = self.client.get(reverse(f'async-{name}', kwargs=kwargs), params)
+
+        self.assertEqual(async_.status_code, sync.status_code)
+        return sync, async_
+
+    def test_views_are_async(self):
+        for view in [AsyncPatchViewSet, AsyncPatchDetail, AsyncPatchContentViewSet, AsyncLandingPageStatViewSet]:
+            self.assertTrue(view.view_is_async)
+
+    def test_default_async_hooks(self):
+        # without aget_validators and aget_response, the synchronous ones run in a thread
+        class View(AsyncViewMixin, AsyncConditionalGetMixin, PatchContentViewSet):
+            pass
+
+        response = async_to_sync(View.as_view())(APIRequestFactory().get('/'), uuid=str(self.patch.uuid))
+        response.render()
+        sync = self.client.get(reverse('patch-content', kwargs={'uuid': self.patch.uuid}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], sync['ETag'])
+        self.assertEqual(json.loads(response.content), sync.json())
+
+    @override_settings(ASYNC_READ_VIEWS=True)
+    def test_read_view_setting(self):
+        self.assertIs(read_view(PatchViewSet, AsyncPatchViewSet), AsyncPatchViewSet)
+
+    def test_patch_list(self):
+        sync, async_ = self.get_both('patch-list')
+
+        self.assertEqual(async_.json()['count'], 3)
+        self.assertEqual(async_.json()['results'], sync.json()['results'])
+
+        # served from the feed cache the second time
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse('async-patch-list'))
+        self.assertEqual(cached.json(), async_.json())
+
+    def test_patch_list_cursor(self):
+        sync, async_ = self.get_both('patch-list', params={'pagination': 'cursor', 'page_size': 2, 'ordering': '-upvotes'})
+
+        self.assertEqual(async_.json()['results'], sync.json()['results'])
+        self.assertEqual(async_.json()['results'][0]['uuid'], str(self.patches[1].uuid))
+
+        response = self.client.get(async_.json()['next'])
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_patch_list_authenticated(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+        sync, async_ = self.get_both('patch-list', params={'author': self.user.id})
+
+        self.assertEqual(async_.json()['results'], sync.json()['results'])
+        upvoted = {patch['uuid']: patch['viewer_has_upvoted'] for patch in async_.json()['results']}
+        self.assertTrue(upvoted[str(self.patches[1].uuid)])
+        self.assertFalse(upvoted[str(self.patches[0].uuid)])
+
+    def test_patch_list_invalid_page(self):
+        self.get_both('patch-list', params={'page': 5})
+
+    def test_patch_detail(self):
+        sync, async_ = self.get_both('patch-detail', kwargs={'uuid': self.patch.uuid}, params={'expand': 'content'})
+
+        self.assertEqual(async_.status_code, 200)
+        self.assertEqual(async_.json(), sync.json())
+        self.assertEqual([block['text'] for block in async_.json()['content']], ['Block 1', 'Block 2'])
+
+        url = reverse('async-patch-detail', kwargs={'uuid': self.patch.uuid})
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, {'expand': 'content'}, HTTP_IF_NONE_MATCH=async_['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_patch_detail_missing(self):
+        sync, async_ = self.get_both('patch-detail', kwargs={'uuid': uuid.uuid4()})
+        self.assertEqual(async_.status_code, 404)
+
+        sync, async_ = self.get_both('patch-detail', kwargs={'uuid': 'invalid-uuid'})
+        self.assertEqual(async_.status_code, 404)
+
+    def test_patch_detail_delete(self):
+        # writes run the synchronous handler
+        response = self.client.delete(reverse('async-patch-detail', kwargs={'uuid': self.patches[2].uuid}))
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Patch.objects.filter(uuid=self.patches[2].uuid).exists())
+
+    def test_patch_content(self):
+        sync, async_ = self.get_both('patch-content', kwargs={'uuid': self.patch.uuid})
+
+        self.assertEqual(async_.status_code, 200)
+        self.assertEqual(async_.json(), sync.json())
+
+        sync, async_ = self.get_both('patch-content', kwargs={'uuid': uuid.uuid4()})
+        self.assertEqual(async_.status_code, 404)
+
+    def test_landing_page_stats(self):
+        sync, async_ = self.get_both('landing-page-stat')
+
+        self.assertEqual(async_.status_code, 200)
+        self.assertEqual(async_.json()['results'], sync.json()['results'])
+
+class TestQueryIndexes(TestCase):
+    def setUp(self):
+        self.user = auth_models.User.objects.create_user(username='testuser', password='12345')
+        self.patch = Patch.objects.create(title='Test Patch', user=self.user, state='published')
+
+        # the tables are tiny, make the planner prefer an ordered index scan whenever one applies
+        with connection.cursor() as cursor:
+            for setting in ['enable_seqscan', 'enable_bitmapscan', 'enable_sort']:
+                cursor.execute(f'SET {setting} = off')
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            for setting in ['enable_seqscan', 'enable_bitmapscan', 'enable_sort']:
+                cursor.execute(f'SET {setting} = on')
+
+    def get_queryset(self, view_class, params=None, **kwargs):
+        request = Request(APIRequestFactory().get('/', params or {}))
+        request.user = self.user
+        view = view_class(request=request, kwargs=kwargs, format_kwarg=None)
+        return view.get_queryset()
+
+    def test_feed_ordered_by_created(self):
+        plan = self.get_queryset(PatchViewSet)[:10].explain()
+        self.assertIn('patch_pub_created_idx', plan)
+
+    def test_feed_ordered_by_upvotes(self):
+        plan = self.get_queryset(PatchViewSet, {'ordering': '-upvotes'})[:10].explain()
+        self.assertIn('patch_pub_upvotes_idx', plan)
+
+    def test_user_patches(self):
+        plan = self.get_queryset(UserPatchViewSet, {'user_id': self.user.id})[:10].explain()
+        self.assertIn('patch_user_created_idx', plan)
+
+    def test_patch_content(self):
+        plan = self.get_queryset(PatchContentViewSet, uuid=str(self.patch.uuid)).explain()
+        self.assertIn('content_post_order_idx', plan)
@@ -0,0 +1,250 @@
+import datetime
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.utils import timezone
+
+UPLOAD_DIRECTORY = 'files'
+# extensions are kept so the stored files are served with the right content type
+EXTENSION_PATTERN = re.compile(r'^\.[a-z0-9]{1,10}$')
+
+def get_max_upload_size():
+    return getattr(settings, 'UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+
+def get_upload_storage():
+    """Return a storage for uploaded files, a new instance so requests never share its location"""
+
+    return FileSystemStorage(
+        location=os.path.join(settings.MEDIA_ROOT, UPLOAD_DIRECTORY),
+        base_url=f'{settings.MEDIA_URL}{UPLOAD_DIRECTORY}/',
+    )
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Upload handler streaming files to a temporary file while hashing them.
+
+    Every chunk is hashed with SHA-256 as it arrives. Once a file grows past max_size the
+    handler stops reading the request and sets too_large, the file is left out of FILES.
+    Completed files carry their sha256 digest.
+    """
+
+    def __init__(self, request=None, max_size=None):
+        super().__init__(request)
+        self.max_size = max_size if max_size is not None else get_max_upload_size()
+        self.too_large = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+
+        self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            self.too_large = True
+            self.file.close()
+            raise StopUpload(connection_reset=True)
+
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hasher.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+
+def content_address(file):
+    """Return the storage name of a hashed upload, files with the same content share it"""
+
+    extension = os.path.splitext(file.name or '')[1].lower()
+    if not EXTENSION_PATTERN.match(extension):
+        extension = ''
+
+    return f'{file.sha256[:2]}/{file.sha256}{extension}'
+
+def store_upload(file, storage=None):
+    """
+    Store a file received by HashingUploadHandler under its content address.
+
+    Returns a (name, url, created) tuple, created is False when the same content was
+    already stored and the upload was dropped.
+    """
+
+    storage = storage or get_upload_storage()
+    name = content_address(file)
+
+    created = not storage.exists(name)
+    if created:
+        # the temporary file is moved into place rather than copied
+        name = storage.save(name, file)
+
+    return name, storage.url(name), created
+
+# Resumable uploads: a session is created with the final size, its parts are PUT one
+# request each (in any order, retried parts replace the previous attempt) and the
+# session is completed once parts 1..n add up to the size. Parts are written to a
+# temporary name and renamed when the whole body arrived, so an interrupted request
+# never leaves a partial part behind.
+
+CHUNK_SIZE = 64 * 1024
+
+class UploadError(ValueError):
+    """Raised when a part or a session cannot be accepted"""
+
+def get_session_root():
+    return getattr(settings, 'UPLOAD_SESSION_ROOT', os.path.join(settings.BASE_DIR, 'upload_sessions'))
+
+def get_session_ttl():
+    return datetime.timedelta(seconds=getattr(settings, 'UPLOAD_SESSION_TTL', 24 * 60 * 60))
+
+def get_max_session_size():
+    return getattr(settings, 'UPLOAD_SESSION_MAX_SIZE', 500 * 1024 * 1024)
+
+def get_max_part_size():
+    return getattr(settings, 'UPLOAD_PART_MAX_SIZE', 8 * 1024 * 1024)
+
+def session_directory(session_id):
+    return os.path.join(get_session_root(), str(session_id))
+
+def part_path(session_id, number):
+    return os.path.join(session_directory(session_id), f'{number:05d}.part')
+
+def list_parts(session_id):
+    """Return the (number, size) pairs of the parts received for a session, in order"""
+
+    try:
+        names = os.listdir(session_directory(session_id))
+    except FileNotFoundError:
+        return []
+
+    parts = []
+    for name in names:
+        if name.endswith('.part'):
+            parts.append((int(name[:-len('.part')]), os.path.getsize(os.path.join(session_directory(session_id), name))))
+
+    return sorted(parts)
+
+def write_part(session, number, stream, length):
+    """
+    Stream one part of a session to disk, replacing an earlier attempt at the same part.
+
+    length is the announced size of the part, the part is only kept when exactly that
+    many bytes arrived. Returns the size of the part.
+    """
+
+    if number < 1:
+        raise UploadError('Part numbers start at 1')
+    if length > get_max_part_size():
+        raise UploadError(f'Parts can be at most {get_max_part_size()} bytes')
+
+    received = sum(size for part, size in list_parts(session.id) if part != number)
+    if received + length > session.size:
+        raise UploadError('The parts are larger than the declared size')
+
+    os.makedirs(session_directory(session.id), exist_ok=True)
+    path = part_path(session.id, number)
+    partial = f'{path}.{uuid.uuid4().hex}.partial'
+
+    written = 0
+    try:
+        with open(partial, 'wb') as file:
+            while written < length:
+                chunk = stream.read(min(CHUNK_SIZE, length - written))
+                if not chunk:
+                    break
+                file.write(chunk)
+                written += len(chunk)
+
+        if written != length:
+            raise UploadError('The part was interrupted')
+
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    return written
+
+def assemble_parts(session):
+    """
+    Concatenate the parts of a session into a hashed temporary file, chunk by chunk.
+
+    Returns a TemporaryUploadedFile which store_upload accepts like a streamed upload.
+    """
+
+    parts = list_parts(session.id)
+    if [number for number, _ in parts] != list(range(1, len(parts) + 1)):
+        raise UploadError('Some parts are missing')
+    if sum(size for _, size in parts) != session.size:
+        raise UploadError('The parts do not add up to the declared size')
+
+    content_type = mimetypes.guess_type(session.filename)[0] or 'application/octet-stream'
+    file = TemporaryUploadedFile(session.filename, content_type, session.size, None)
+    hasher = hashlib.sha256()
+
+    for number, _ in parts:
+        with open(part_path(session.id, number), 'rb') as part:
+            for chunk in iter(lambda: part.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+                file.write(chunk)
+
+    file.seek(0)
+    file.sha256 = hasher.hexdigest()
+    return file
+
+def discard_session(session):
+    """Delete a session and its parts"""
+
+    shutil.rmtree(session_directory(session.id), ignore_errors=True)
+    session.delete()
+
+def collect_upload_sessions(now=None):
+    """
+    Delete expired sessions with their parts, and part directories without a session.
+
+    Returns the number of directories removed.
+    """
+
+    from .models import UploadSession
+
+    now = now or timezone.now()
+    UploadSession.objects.filter(expires__lt=now).delete()
+
+    try:
+        directories = os.listdir(get_session_root())
+    except FileNotFoundError:
+        return 0
+
+    live = {str(session_id) for session_id in UploadSession.objects.filter(id__in=[
+        name for name in directories if _is_uuid(name)
+    ]).values_list('id', flat=True)}
+
+    removed = 0
+    for name in directories:
+        if name not in live:
+            shutil.rmtree(os.path.join(get_session_root(), name), ignore_errors=True)
+            removed += 1
+
+    return removed
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 
 from rest_framework_simplejwt.views import (
@@ -12,6 +13,7 @@ from .views import UserPatchViewSet
 from .views import PatchContentViewSet
 from .views import PatchCreate
 from .views import PatchDetail
+from .views import PatchSearchView
 from .views import upvote_patch
 
 # user views
@@ -19,21 +21,40 @@ from .views import LogoutView
 from .views import CurrentProfileDetail
 from .views import ProfileDetail
 from .views import UserViewset
+from .views import UserBatchView
 
 # other views
 from .views import LandingPageStatViewSet
 from .views import UploadView
+from .views import UploadSessionCreate
+from .views import UploadSessionDetail
+from .views import UploadPartView
+from .views import UploadSessionComplete
+from .views import SuggestionView
+
+# async read views, served under async/ and in place of the sync views with ASYNC_READ_VIEWS
+from .async_views import AsyncPatchViewSet
+from .async_views import AsyncPatchDetail
+from .async_views import AsyncPatchContentViewSet
+from .async_views import AsyncLandingPageStatViewSet
+
+def read_view(sync_view, async_view):
+    """Return the view serving a read endpoint, the async one when ASYNC_READ_VIEWS is set"""
+
+    return async_view if getattr(settings, 'ASYNC_READ_VIEWS', False) else sync_view
 
 urlpatterns = [
-    path('patches/', PatchViewSet.as_view(), name='patch-list'),
+    path('patches/', read_view(PatchViewSet, AsyncPatchViewSet).as_view(), name='patch-list'),
     path('patches/new/', PatchCreate.as_view(), name='new-patch'),
     path('patches/user/', UserPatchViewSet.as_view(), name='user-patches'),
-    path('patches/<uuid>/', PatchDetail.as_view(), name='patch-detail'),
-    path('patches/<uuid>/content', PatchContentViewSet.as_view(), name='patch-content'),
+    path('patches/search/', PatchSearchView.as_view(), name='patch-search'),
+    path('patches/<uuid>/', read_view(PatchDetail, AsyncPatchDetail).as_view(), name='patch-detail'),
+    path('patches/<uuid>/content', read_view(PatchContentViewSet, AsyncPatchContentViewSet).as_view(), name='patch-content'),
     path('patches/<uuid>/upvote/', upvote_patch, name='upvote-patch'),
     path('patches/<uuid>/update/', PatchUpdateView.as_view(), name='update-patch'),
 
     path('user/', UserViewset.as_view(), name='user-detail'),
+    path('users/batch/', UserBatchView.as_view(), name='user-batch'),
     path('register/', UserViewset.as_view(), name='user-create'),
     path('login/', TokenObtainPairView.as_view(), name='token-obtain-pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
@@ -41,7 +62,17 @@ urlpatterns = [
     path('profile/me', CurrentProfileDetail.as_view(), name='current-profile'),
     path('profile/<int:id>', ProfileDetail.as_view(), name='user-profile'),
 
-    path('LandingPageStat/', LandingPageStatViewSet.as_view(), name='landing-page-stat'),
+    path('LandingPageStat/', read_view(LandingPageStatViewSet, AsyncLandingPageStatViewSet).as_view(), name='landing-page-stat'),
     path('upload/', UploadView.as_view(), name='upload'),
+    path('upload/sessions/', UploadSessionCreate.as_view(), name='upload-session-create'),
+    path('upload/sessions/<uuid:id>/', UploadSessionDetail.as_view(), name='upload-session'),
+    path('upload/sessions/<uuid:id>/parts/<int:number>/', UploadPartView.as_view(), name='upload-part'),
+    path('upload/sessions/<uuid:id>/complete/', UploadSessionComplete.as_view(), name='upload-session-complete'),
+    path('suggest/', SuggestionView.as_view(), name='suggest'),
+
+    path('async/patches/', AsyncPatchViewSet.as_view(), name='async-patch-list'),
+    path('async/patches/<uuid>/', AsyncPatchDetail.as_view(), name='async-patch-detail'),
+    path('async/patches/<uuid>/content', AsyncPatchContentViewSet.as_view(), name='async-patch-content'),
+    path('async/LandingPageStat/', AsyncLandingPageStatViewSet.as_view(), name='async-landing-page-stat'),
 
 ] 
\ No newline at end of file
@@ -1,39 +1,70 @@
 import logging
 from uuid import UUID
 import datetime
-import os
 
-from django.shortcuts import render, get_list_or_404
+from django.shortcuts import render
 from django.contrib.auth import models as auth_models
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
-from django.core.files.storage import default_storage
 from django.conf import settings
+from django.db.models import Count, Exists, Max, OuterRef, Q, Subquery, Value
+from django.utils import timezone
 
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, NotFound
 from rest_framework.filters import OrderingFilter
+from django_filters.rest_framework import DjangoFilterBackend
+from .filters import PatchFilter
 from .pagination import PatchPagination
 
 from .models import Patch
 from .models import PatchContent
 from .models import LandingPageStat
 from .models import Profile
+from .models import UploadSession
 
 from .serializers import PatchSerializer
+from .serializers import PatchDetailSerializer
 from .serializers import PatchContentSerializer
 from .serializers import LandingPageStatSerializer
 from .serializers import UserSerializer
 from .serializers import UserDetailSerializer
 from .serializers import ProfileSerializer
+from .serializers import UserProfileSerializer
 
 from .exceptions import InvalidUUIDException
 
+from .conditional import ConditionalGetMixin
+
+from .authentication import CachedRefreshToken
+
+from .cache import is_feed_cacheable
+from .cache import get_feed_cache_key
+from .cache import get_stats_cache_key
+from .cache import get_or_compute
+
+from .search import search_patches
+from .search import suggest
+
+from .uploads import HashingUploadHandler
+from .uploads import UploadError
+from .uploads import store_upload
+from .uploads import get_max_session_size
+from .uploads import get_max_part_size
+from .uploads import get_session_ttl
+from .uploads import list_parts
+from .uploads import write_part
+from .uploads import assemble_parts
+from .uploads import discard_session
+
+from .votes import add_upvote
+from .votes import remove_upvote
+from .votes import vote_buffer
+
 logger = logging.getLogger(__name__)
 
 class LogoutView(APIView):
@@ -44,7 +75,7 @@ class LogoutView(APIView):
 
         try:
             refresh_token = request.data["refresh_token"]
-            token = RefreshToken(refresh_token)
+            token = CachedRefreshToken(refresh_token)
             token.blacklist()
             return Response(status=status.HTTP_205_RESET_CONTENT)
         except Exception:
@@ -56,8 +87,9 @@ class PatchViewSet(generics.ListAPIView):
     serializer_class = PatchSerializer
     pagination_class = PatchPagination
 
-    filter_backends = [OrderingFilter]
-    ordering_fields = ['created', 'upvotes', 'updated_at']
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = PatchFilter
+    ordering_fields = ['created', 'upvotes', 'trending', 'updated_at']
     ordering = '-created'
 
     def get_queryset(self):
@@ -72,10 +104,21 @@ class PatchViewSet(generics.ListAPIView):
             # Default ordering
             queryset = queryset.order_by(self.ordering)
 
-        return queryset
+        # load the relations needed by the serializer in bulk
+        return self.get_serializer_class().plan_queryset(queryset, self.request, many=True)
 
     def get(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
+        # anonymous feed pages are shared until the feed changes
+        if is_feed_cacheable(request):
+            data = get_or_compute(get_feed_cache_key(request), lambda: self.list_page(request).data)
+            return Response(data)
+
+        return self.list_page(request)
+
+    def list_page(self, request):
+        """Method to return the response for a page of the feed"""
+
+        queryset = self.filter_queryset(self.get_queryset())
 
         # Paginate the queryset
         page = self.paginate_queryset(queryset)
@@ -87,6 +130,52 @@ class PatchViewSet(generics.ListAPIView):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+class PatchSearchView(generics.ListAPIView):
+    """View for searching published patches by their title, description and content"""
+
+    queryset = Patch.objects.all()
+    serializer_class = PatchSerializer
+    pagination_class = PatchPagination
+
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = PatchFilter
+
+    def get_queryset(self):
+        text = self.request.query_params.get('q', '').strip()
+        queryset = search_patches(self.queryset.filter(state='published'), text)
+
+        # load the relations needed by the serializer in bulk
+        return self.get_serializer_class().plan_queryset(queryset, self.request, many=True)
+
+    def get(self, request, *args, **kwargs):
+        if not request.query_params.get('q', '').strip():
+            return Response({'detail': 'No search query was given'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # keyset pages are ordered by a column, they would drop the relevance ranking
+        if self.paginator.is_cursor_mode(request):
+            return Response({'detail': 'Search results do not support cursor pagination'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self.list(request, *args, **kwargs)
+
+class SuggestionView(APIView):
+    """View for suggesting patch titles and usernames while the user types"""
+
+    permission_classes = [AllowAny]
+    default_limit = 5
+    max_limit = 20
+
+    def get(self, request):
+        """Return the best matching titles and usernames for ?q="""
+
+        text = request.query_params.get('q', '').strip()
+
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response({'detail': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(suggest(text, max(limit, 1)))
+
 class UserPatchViewSet(generics.ListAPIView):
     """View for listing patches created by the user"""
 
@@ -94,8 +183,9 @@ class UserPatchViewSet(generics.ListAPIView):
     serializer_class = PatchSerializer
     pagination_class = PatchPagination
 
-    filter_backends = [OrderingFilter]
-    ordering_fields = ['created', 'upvotes', 'updated_at']
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = PatchFilter
+    ordering_fields = ['created', 'upvotes', 'trending', 'updated_at']
     ordering = '-created'
 
     def get_queryset(self):
@@ -120,10 +210,11 @@ class UserPatchViewSet(generics.ListAPIView):
             # Default ordering
             queryset = queryset.order_by(self.ordering)
 
-        return queryset
+        # load the relations needed by the serializer in bulk
+        return self.get_serializer_class().plan_queryset(queryset, self.request, many=True)
 
     def get(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
+        queryset = self.filter_queryset(self.get_queryset())
 
         # Paginate the queryset
         page = self.paginate_queryset(queryset)
@@ -189,14 +280,77 @@ class PatchCreate(generics.CreateAPIView):
         logger.error('Validation errors: %s', serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class PatchDetail(generics.RetrieveUpdateDestroyAPIView):
+class PatchDetail(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     """View for retrieving, updating and deleting a patch"""
 
     queryset = Patch.objects.all()
     serializer_class = PatchSerializer
     lookup_field = 'uuid'
 
-class PatchContentViewSet(generics.ListAPIView):
+    def get_expand(self):
+        """Method to return the relations requested with ?expand="""
+
+        expand = self.request.query_params.get('expand', '')
+        return {field.strip() for field in expand.split(',') if field.strip()}
+
+    def get_serializer_class(self):
+        # embed the ordered content blocks, saving the client a request to PatchContentViewSet
+        if self.request.method == 'GET' and 'content' in self.get_expand():
+            return PatchDetailSerializer
+        return self.serializer_class
+
+    def get_queryset(self):
+        return self.get_serializer_class().plan_queryset(self.queryset, self.request)
+
+    def get_validators_query(self):
+        """Method to return the query of the validators, None when the uuid is invalid"""
+
+        try:
+            uuid = UUID(self.kwargs['uuid'])
+        except ValueError:
+            return None
+
+        # upvoted_by and viewer_has_upvoted follow the through table, which votes write without saving the patch
+        votes = Patch.upvoted_by.through.objects.filter(patch_id=OuterRef('pk')).order_by().values('patch_id')
+        viewer_vote = Value(False)
+        if self.request.user.is_authenticated:
+            viewer_vote = Exists(votes.filter(user_id=self.request.user.id))
+
+        queryset = (Patch.objects.filter(uuid=uuid)
+                    .annotate(voters=Subquery(votes.annotate(count=Count('id')).values('count')),
+                              last_vote=Subquery(votes.annotate(last=Max('id')).values('last')),
+                              viewer_vote=viewer_vote))
+        fields = ['updated', 'upvotes', 'image_derivatives', 'user__username', 'voters', 'last_vote', 'viewer_vote']
+
+        # embedded blocks, with the validators of PatchContentViewSet
+        if self.request.method == 'GET' and 'content' in self.get_expand():
+            queryset = queryset.annotate(blocks=Count('content'), last_block=Max('content__id'),
+                                         processed=Count('content', filter=~Q(content__image_derivatives={})))
+            fields += ['blocks', 'last_block', 'processed']
+
+        return queryset.values_list(*fields)
+
+    def build_validators(self, state):
+        """Method to build the validators from the row of the validators query"""
+
+        if state is None:
+            return None
+
+        updated, upvotes, *version = state
+        if vote_buffer.enabled:
+            patch_uuid = UUID(self.kwargs['uuid'])
+            upvotes += vote_buffer.pending_count(patch_uuid)
+            if self.request.user.is_authenticated:
+                version.append(vote_buffer.is_pending(patch_uuid, self.request.user.id))
+
+        # votes, derivatives and renames change the body without touching updated, so only the ETag covers them
+        return (updated, upvotes, *version, self.request.user.id), None
+
+    def get_validators(self):
+        query = self.get_validators_query()
+        return self.build_validators(query.first()) if query is not None else None
+
+class PatchContentViewSet(ConditionalGetMixin, generics.ListAPIView):
     """View for listing patch contents"""
 
     queryset = PatchContent.objects.all()
@@ -211,20 +365,65 @@ class PatchContentViewSet(generics.ListAPIView):
         except ValueError as exc:
             raise InvalidUUIDException() from exc
 
-        patch = get_list_or_404(Patch, uuid=patch_uuid)
-        return PatchContent.objects.filter(post=patch[0])
+        queryset = PatchContent.objects.filter(post_id=patch_uuid).order_by('order')
+        return PatchContentSerializer.plan_queryset(queryset, self.request, many=True)
 
-    def get(self, request, *args, **kwargs):
+    def get_validators_query(self):
+        """Method to return the query of the validators"""
+
+        try:
+            patch_uuid = UUID(self.kwargs['uuid'])
+        except ValueError as exc:
+            raise InvalidUUIDException() from exc
+
+        # content edits save the patch, the block count and last id catch added and removed blocks,
+        # processed blocks catch image derivatives written after the edit
+        return (Patch.objects.filter(uuid=patch_uuid)
+                .annotate(blocks=Count('content'), last_block=Max('content__id'),
+                          processed=Count('content', filter=~Q(content__image_derivatives={})))
+                .values_list('updated', 'blocks', 'last_block', 'processed'))
+
+    def build_validators(self, state):
+        """Method to build the validators from the row of the validators query"""
+
+        # also tells a missing patch from one without content
+        if state is None:
+            raise NotFound()
+
+        # image derivatives change the body without touching updated, so only the ETag covers them
+        return state, None
+
+    def get_validators(self):
+        return self.build_validators(self.get_validators_query().first())
+
+    def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
-        serializer = PatchContentSerializer(queryset, many=True)
+
+        serializer = PatchContentSerializer(queryset, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
 
-class LandingPageStatViewSet(generics.ListAPIView):
+class LandingPageStatViewSet(ConditionalGetMixin, generics.ListAPIView):
     """View for listing landing page stats"""
 
     queryset = LandingPageStat.objects.all()
     serializer_class = LandingPageStatSerializer
 
+    def get_stats(self):
+        """Method to return the page of stats, shared by all clients for STATS_CACHE_TIMEOUT seconds"""
+
+        if not hasattr(self, 'stats'):
+            timeout = getattr(settings, 'STATS_CACHE_TIMEOUT', 10)
+            self.stats = get_or_compute(get_stats_cache_key(self.request), lambda: super(LandingPageStatViewSet, self).list(self.request).data, timeout)
+
+        return self.stats
+
+    def get_validators(self):
+        # the cached page is its own version, a 304 costs no query
+        return self.get_stats(), None
+
+    def list(self, request, *args, **kwargs):
+        return Response(self.get_stats())
+
 class UserViewset(generics.ListCreateAPIView):
     """View for listing and creating users"""
 
@@ -246,8 +445,8 @@ class UserViewset(generics.ListCreateAPIView):
         if not self.request.user.is_authenticated:
             return Response(status=status.HTTP_403_FORBIDDEN)
 
-        user = auth_models.User.objects.get(id=request.user.id)
-        serializer = UserDetailSerializer(user)
+        # the authentication already loaded the user
+        serializer = UserDetailSerializer(request.user)
         return Response(serializer.data)
 
     def post(self, request, *args, **kwargs):
@@ -283,7 +482,36 @@ class UserViewset(generics.ListCreateAPIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class CurrentProfileDetail(generics.RetrieveUpdateAPIView):
+class UserBatchView(APIView):
+    """View for looking up several users with their profiles at once"""
+
+    permission_classes = [AllowAny]
+    max_ids = 100
+
+    def get(self, request):
+        """Return the users of ?ids=1,2,3 in the requested order, ids without a user are listed as missing"""
+
+        try:
+            ids = [int(id) for id in request.query_params.get('ids', '').split(',') if id.strip()]
+        except ValueError:
+            return Response({'detail': 'Invalid ids'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # repeated ids are returned once
+        ids = list(dict.fromkeys(ids))
+
+        if not ids:
+            return Response({'detail': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.max_ids:
+            return Response({'detail': f'At most {self.max_ids} ids can be requested'}, status=status.HTTP_400_BAD_REQUEST)
+
+        users = {user.id: user for user in auth_models.User.objects.filter(id__in=ids).select_related('profile')}
+
+        return Response({
+            'results': UserProfileSerializer([users[id] for id in ids if id in users], many=True, context={'request': request}).data,
+            'missing': [id for id in ids if id not in users],
+        })
+
+class CurrentProfileDetail(ConditionalGetMixin, generics.RetrieveUpdateAPIView):
     """View for retrieving and updating the current user's profile"""
 
     queryset = Profile.objects.all()
@@ -291,20 +519,29 @@ class CurrentProfileDetail(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
+        # cached along with the user by the authentication
         return self.request.user.profile
 
-class ProfileDetail(generics.RetrieveUpdateAPIView):
+    def get_validators(self):
+        state = Profile.objects.filter(user=self.request.user).values_list('updated', 'image_derivatives', 'user__username').first()
+        # image derivatives and renames change the body without touching updated, so only the ETag covers them
+        return (state, None) if state else None
+
+class ProfileDetail(ConditionalGetMixin, generics.RetrieveUpdateAPIView):
     """View for retrieving and updating a user's profile"""
 
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
     lookup_field = "id"
 
+    def get_validators(self):
+        state = Profile.objects.filter(id=self.kwargs['id']).values_list('updated', 'image_derivatives', 'user__username').first()
+        return (state, None) if state else None
+
     @action(detail=False, methods=['get'])
     def me(self, request):
         """View for retrieving the current user's profile"""
-        profile = self.get_queryset().get(user=request.user)
-        serializer = self.get_serializer(profile)
+        serializer = self.get_serializer(request.user.profile)
         return Response(serializer.data)
 
 class UploadView(APIView):
@@ -316,17 +553,160 @@ class UploadView(APIView):
         if not request.user.is_authenticated:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
 
+        # stream the file to disk while hashing it, before the body is parsed
+        handler = HashingUploadHandler(request._request)
+        request._request.upload_handlers = [handler]
+
         file = request.FILES.get('file')
 
+        if handler.too_large:
+            return Response({'detail': f'File is larger than {handler.max_size} bytes'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
         if not file:
             return Response({'detail': 'No file was uploaded'}, status=status.HTTP_400_BAD_REQUEST)
 
-        default_storage.location = os.path.join(settings.MEDIA_ROOT, 'files')
-        filename = default_storage.save(file.name, file)
-        file_url = os.path.join(os.path.join(settings.MEDIA_URL, "files"), filename)
-        absolute_url = request.build_absolute_uri(file_url)
+        try:
+            _, file_url, created = store_upload(file)
+        finally:
+            file.close()
+
+        return Response({
+            'url': request.build_absolute_uri(file_url),
+            'sha256': file.sha256,
+            'size': file.size,
+            'deduplicated': not created,
+        }, status=status.HTTP_201_CREATED)
+
+class UploadSessionMixin:
+    """Mixin for the views of a resumable upload, sessions are only visible to their owner"""
+
+    def get_session(self, request, id):
+        if not request.user.is_authenticated:
+            return None, Response(status=status.HTTP_401_UNAUTHORIZED)
+
+        session = UploadSession.objects.filter(id=id, user=request.user, expires__gte=timezone.now()).first()
+        if session is None:
+            return None, Response({'detail': 'Upload session not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        return session, None
 
-        return Response({'url': absolute_url}, status=status.HTTP_201_CREATED)
+    def get_session_data(self, session):
+        return {
+            'id': session.id,
+            'filename': session.filename,
+            'size': session.size,
+            'part_size': get_max_part_size(),
+            'expires': session.expires,
+            'parts': [{'number': number, 'size': size} for number, size in list_parts(session.id)],
+        }
+
+class UploadSessionCreate(UploadSessionMixin, APIView):
+    """View for starting a resumable upload"""
+
+    def post(self, request):
+        """Start a resumable upload of a file of the given size"""
+
+        if not request.user.is_authenticated:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+        filename = request.data.get('filename')
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({'detail': 'size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not filename or len(filename) > 255:
+            return Response({'detail': 'filename is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if size < 1:
+            return Response({'detail': 'size must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+        if size > get_max_session_size():
+            return Response({'detail': f'File is larger than {get_max_session_size()} bytes'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        session = UploadSession.objects.create(
+            user=request.user,
+            filename=filename,
+            size=size,
+            expires=timezone.now() + get_session_ttl(),
+        )
+
+        return Response(self.get_session_data(session), status=status.HTTP_201_CREATED)
+
+class UploadSessionDetail(UploadSessionMixin, APIView):
+    """View for resuming or aborting a resumable upload"""
+
+    def get(self, request, id):
+        """Return the session with the parts received so far"""
+
+        session, error = self.get_session(request, id)
+        if error:
+            return error
+
+        return Response(self.get_session_data(session))
+
+    def delete(self, request, id):
+        """Abort the upload and delete its parts"""
+
+        session, error = self.get_session(request, id)
+        if error:
+            return error
+
+        discard_session(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class UploadPartView(UploadSessionMixin, APIView):
+    """View for uploading one part of a resumable upload, the raw request body is the part"""
+
+    def put(self, request, id, number):
+        """Store a part, a part uploaded again replaces the previous one"""
+
+        session, error = self.get_session(request, id)
+        if error:
+            return error
+
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or '')
+        except ValueError:
+            return Response({'detail': 'Content-Length is required'}, status=status.HTTP_411_LENGTH_REQUIRED)
+
+        # read the body directly, it is written to disk in chunks and never parsed
+        try:
+            size = write_part(session, number, request._request, length)
+        except UploadError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # every part keeps an active upload alive
+        UploadSession.objects.filter(id=session.id).update(expires=timezone.now() + get_session_ttl())
+
+        return Response({'number': number, 'size': size})
+
+class UploadSessionComplete(UploadSessionMixin, APIView):
+    """View for completing a resumable upload"""
+
+    def post(self, request, id):
+        """Assemble the parts and store the file like a single upload"""
+
+        session, error = self.get_session(request, id)
+        if error:
+            return error
+
+        try:
+            file = assemble_parts(session)
+        except UploadError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            _, file_url, created = store_upload(file)
+        finally:
+            file.close()
+
+        discard_session(session)
+
+        return Response({
+            'url': request.build_absolute_uri(file_url),
+            'sha256': file.sha256,
+            'size': file.size,
+            'deduplicated': not created,
+        }, status=status.HTTP_201_CREATED)
 
 def index(request):
     """Display the index page"""
@@ -338,9 +718,9 @@ def patch_detail(request, title=None):
 
     return render(request, 'index.html', {'title': title})
 
-@api_view(['POST'])
+@api_view(['POST', 'DELETE'])
 def upvote_patch(request, uuid):
-    """Method for upvoting a patch"""
+    """Method for upvoting a patch or withdrawing the upvote"""
 
     if not request.user.is_authenticated:
         return Response(status=status.HTTP_403_FORBIDDEN)
@@ -350,9 +730,24 @@ def upvote_patch(request, uuid):
     except ValueError as exc:
         raise InvalidUUIDException() from exc
 
-    post = Patch.objects.get(uuid=uuid)
-    upvoted = post.upvote(request.user)
+    # with the vote buffer enabled votes are written in batches by its flusher
+    if vote_buffer.enabled:
+        vote = vote_buffer.remove if request.method == 'DELETE' else vote_buffer.add
+    else:
+        vote = remove_upvote if request.method == 'DELETE' else add_upvote
+
+    result = vote(uuid, request.user.id)
+
+    if result is None:
+        raise NotFound()
+
+    changed, upvotes = result
+
+    if request.method == 'DELETE':
+        if changed:
+            return Response({'detail': 'Upvote succesfully removed', 'upvotes': upvotes}, status=status.HTTP_200_OK)
+        return Response({'detail': 'Not upvoted', 'upvotes': upvotes}, status=status.HTTP_400_BAD_REQUEST)
 
-    if upvoted:
-        return Response({'detail': 'Post succesfully upvoted'}, status=status.HTTP_200_OK)
-    return Response({'detail': 'Already upvoted'}, status=status.HTTP_400_BAD_REQUEST)
+    if changed:
+        return Response({'detail': 'Post succesfully upvoted', 'upvotes': upvotes}, status=status.HTTP_200_OK)
+    return Response({'detail': 'Already upvoted', 'upvotes': upvotes}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,349 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Patch
+from .cache import bump_feed_version
+from .stats import stat_buffer
+from .ranking import hot_score_sql
+
+logger = logging.getLogger(__name__)
+
+# Both statements change the through table and the counter in a single round-trip:
+# the data-modifying CTE reports how many rows it touched and the UPDATE applies
+# that delta to the stored counter (upvotes = upvotes +/- delta), so concurrent
+# votes never overwrite each other and only the upvotes column is written, along
+# with the trending score derived from it.
+# The total upvotes stat is not written here, its single row would serialize every
+# vote, the delta is queued in patcher.stats.stat_buffer and applied in batches.
+
+UPVOTE_SQL = """
+WITH vote AS (
+    INSERT INTO {through} ({patch_column}, {user_column})
+    SELECT %(patch)s, %(user)s
+    WHERE EXISTS (SELECT 1 FROM {patch_table} WHERE {patch_pk} = %(patch)s)
+    ON CONFLICT DO NOTHING
+    RETURNING 1
+)
+UPDATE {patch_table}
+SET upvotes = upvotes + (SELECT COUNT(*) FROM vote),
+    trending = {trending_up}
+WHERE {patch_pk} = %(patch)s
+RETURNING upvotes, (SELECT COUNT(*) FROM vote)
+"""
+
+UNVOTE_SQL = """
+WITH vote AS (
+    DELETE FROM {through}
+    WHERE {patch_column} = %(patch)s AND {user_column} = %(user)s
+    RETURNING 1
+)
+UPDATE {patch_table}
+SET upvotes = upvotes - (SELECT COUNT(*) FROM vote),
+    trending = {trending_down}
+WHERE {patch_pk} = %(patch)s
+RETURNING upvotes, (SELECT COUNT(*) FROM vote)
+"""
+
+def _format(sql):
+    """Fill in the table and column names of the upvote tables"""
+
+    through = Patch.upvoted_by.through
+    quote = connection.ops.quote_name
+
+    return sql.format(
+        through=quote(through._meta.db_table),
+        patch_column=quote(through._meta.get_field('patch').column),
+        user_column=quote(through._meta.get_field('user').column),
+        patch_table=quote(Patch._meta.db_table),
+        patch_pk=quote(Patch._meta.pk.column),
+        trending_up=hot_score_sql('upvotes + (SELECT COUNT(*) FROM vote)', 'created'),
+        trending_down=hot_score_sql('upvotes - (SELECT COUNT(*) FROM vote)', 'created'),
+        trending_bulk=hot_score_sql('upvotes + delta.votes', 'created'),
+    )
+
+def _execute(sql, patch_id, user_id, delta):
+    with connection.cursor() as cursor:
+        cursor.execute(_format(sql), {'patch': patch_id, 'user': user_id})
+        row = cursor.fetchone()
+
+    # the patch does not exist
+    if row is None:
+        return None
+
+    upvotes, changed = row
+
+    # raw SQL skips the m2m_changed signal, invalidate the cached feed pages and count the vote here
+    if changed:
+        bump_feed_version()
+        stat_buffer.add('total_upvotes', delta)
+
+    return bool(changed), upvotes
+
+def add_upvote(patch_id, user_id):
+    """
+    Record an upvote of the user on the patch.
+
+    Returns a (changed, upvotes) tuple, changed is False when the user had already upvoted
+    the patch. Returns None when the patch does not exist.
+    """
+
+    return _execute(UPVOTE_SQL, patch_id, user_id, 1)
+
+def remove_upvote(patch_id, user_id):
+    """
+    Withdraw an upvote of the user on the patch.
+
+    Returns a (changed, upvotes) tuple, changed is False when the user had not upvoted
+    the patch. Returns None when the patch does not exist.
+    """
+
+    return _execute(UNVOTE_SQL, patch_id, user_id, -1)
+
+BULK_UPVOTE_SQL = """
+WITH vote AS (
+    INSERT INTO {through} ({patch_column}, {user_column})
+    SELECT pending.patch, pending.user_id
+    FROM unnest(%(patches)s::uuid[], %(users)s::bigint[]) AS pending (patch, user_id)
+    WHERE EXISTS (SELECT 1 FROM {patch_table} WHERE {patch_pk} = pending.patch)
+    ON CONFLICT DO NOTHING
+    RETURNING {patch_column} AS patch
+), delta AS (
+    SELECT patch, COUNT(*) AS votes FROM vote GROUP BY patch
+)
+UPDATE {patch_table}
+SET upvotes = upvotes + delta.votes,
+    trending = {trending_bulk}
+FROM delta
+WHERE {patch_pk} = delta.patch
+RETURNING delta.votes
+"""
+
+VOTE_STATE_SQL = """
+SELECT upvotes, EXISTS (
+    SELECT 1 FROM {through} WHERE {patch_column} = %(patch)s AND {user_column} = %(user)s
+)
+FROM {patch_table}
+WHERE {patch_pk} = %(patch)s
+"""
+
+def add_upvotes_bulk(votes):
+    """
+    Record a batch of (patch_id, user_id) upvotes, votes which already exist are skipped.
+
+    Returns the number of upvotes written.
+    """
+
+    if not votes:
+        return 0
+
+    patches, users = zip(*votes)
+
+    with connection.cursor() as cursor:
+        cursor.execute(_format(BULK_UPVOTE_SQL), {'patches': list(patches), 'users': list(users)})
+        written = sum(row[0] for row in cursor.fetchall())
+
+    stat_buffer.add('total_upvotes', written)
+    return written
+
+class VoteBuffer:
+    """
+    In-process write-behind buffer for upvotes.
+
+    Upvotes are kept in memory and periodically flushed in batches, so a trending patch
+    takes one counter update per flush instead of one per vote. Pending votes are lost if
+    the process dies before a flush.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # patch id -> set of user ids, votes waiting for the next flush
+        self.pending = {}
+        # votes taken by a flush which is still running, counted until it commits
+        self.flushing = {}
+        # (patch id, user id) pairs of the batch being written, and its commit notification
+        self.writing = set()
+        self.written = threading.Condition(self.lock)
+        # incremented whenever a batch commits, tells count_upvotes its snapshot went stale
+        self.generation = 0
+        self.flusher = None
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'VOTE_BUFFER_ENABLED', False)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'VOTE_BUFFER_FLUSH_INTERVAL', 2)
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'VOTE_BUFFER_BATCH_SIZE', 1000)
+
+    def pending_count(self, patch_id):
+        """Number of upvotes of the patch which were not written to the database yet"""
+
+        return len(self.pending.get(patch_id, ())) + len(self.flushing.get(patch_id, ()))
+
+    def is_pending(self, patch_id, user_id):
+        """Check if an upvote of the user on the patch was not written to the database yet"""
+
+        return user_id in self.pending.get(patch_id, ()) or user_id in self.flushing.get(patch_id, ())
+
+    def _get_state(self, patch_id, user_id):
+        """Return the persisted (upvotes, has_upvoted) pair for a patch, None if it does not exist"""
+
+        with connection.cursor() as cursor:
+            cursor.execute(_format(VOTE_STATE_SQL), {'patch': patch_id, 'user': user_id})
+            return cursor.fetchone()
+
+    def count_upvotes(self, patch_id):
+        """
+        Return the persisted upvotes of a patch plus its buffered votes, None if it does not exist.
+
+        A flush committing between the buffer snapshot and the read would count its votes
+        twice, the read is retried until no batch was committed meanwhile.
+        """
+
+        for _ in range(3):
+            with self.lock:
+                generation = self.generation
+                buffered = self.pending_count(patch_id)
+
+            upvotes = Patch.objects.filter(pk=patch_id).values_list('upvotes', flat=True).first()
+            if upvotes is None:
+                return None
+
+            with self.lock:
+                if self.generation == generation:
+                    break
+
+        return upvotes + buffered
+
+    def add(self, patch_id, user_id):
+        """
+        Buffer an upvote of the user on the patch.
+
+        Returns a (changed, upvotes) tuple like add_upvote, upvotes includes pending votes.
+        Returns None when the patch does not exist.
+        """
+
+        # a plain read, the patch row is not locked
+        state = self._get_state(patch_id, user_id)
+        if state is None:
+            return None
+
+        _, has_upvoted = state
+
+        with self.lock:
+            changed = not has_upvoted and user_id not in self.flushing.get(patch_id, ())
+            if changed:
+                votes = self.pending.setdefault(patch_id, set())
+                changed = user_id not in votes
+                votes.add(user_id)
+
+        self.start()
+        return changed, self.count_upvotes(patch_id)
+
+    def remove(self, patch_id, user_id):
+        """Withdraw an upvote, dropping it from the buffer if it was not written yet"""
+
+        with self.lock:
+            buffered = user_id in self.pending.get(patch_id, ())
+            self.pending.get(patch_id, set()).discard(user_id)
+
+            # a vote taken by a flush is skipped if its batch was not started, otherwise
+            # the withdrawal waits for the batch to commit and deletes the written vote
+            if not buffered and user_id in self.flushing.get(patch_id, ()):
+                while (patch_id, user_id) in self.writing:
+                    self.written.wait()
+
+                buffered = user_id in self.flushing.get(patch_id, ())
+                self.flushing.get(patch_id, set()).discard(user_id)
+
+        if not buffered:
+            result = remove_upvote(patch_id, user_id)
+            if result is None:
+                return None
+            buffered = result[0]
+
+        upvotes = self.count_upvotes(patch_id)
+        if upvotes is None:
+            return None
+
+        return buffered, upvotes
+
+    def flush(self):
+        """Write all pending upvotes to the database in batches, returns the number of votes written"""
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushing = pending
+
+        votes = [(patch_id, user_id) for patch_id, users in pending.items() for user_id in users]
+        written = 0
+
+        try:
+            for start in range(0, len(votes), self.batch_size):
+                # votes withdrawn since the snapshot are left out
+                with self.lock:
+                    batch = [(patch_id, user_id) for patch_id, user_id in votes[start:start + self.batch_size]
+                             if user_id in self.flushing.get(patch_id, ())]
+                    self.writing = set(batch)
+
+                try:
+                    add_upvotes_bulk(batch)
+                except Exception:
+                    # keep the votes which were not written for the next flush
+                    with self.lock:
+                        for patch_id, user_id in votes[start:]:
+                            if user_id in self.flushing.get(patch_id, ()):
+                                self.pending.setdefault(patch_id, set()).add(user_id)
+                    raise
+
+                with self.lock:
+                    for patch_id, user_id in batch:
+                        self.flushing[patch_id].discard(user_id)
+                    self.writing = set()
+                    self.generation += 1
+                    self.written.notify_all()
+
+                written += len(batch)
+        finally:
+            with self.lock:
+                self.flushing = {}
+                self.writing = set()
+                self.generation += 1
+                self.written.notify_all()
+
+        if written:
+            bump_feed_version()
+
+        return written
+
+    def start(self):
+        """Start the background flusher, a non-positive interval leaves flushing to the caller"""
+
+        if self.flusher is not None or self.flush_interval <= 0:
+            return
+
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self._run, name='vote-buffer-flusher', daemon=True)
+                self.flusher.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing buffered upvotes failed')
+                connection.close()
+
+vote_buffer = VoteBuffer()